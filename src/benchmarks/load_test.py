@@ -0,0 +1,258 @@
+import argparse
+import io
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import requests
+
+"""
+Replay a mixed workload against a running server and report throughput / latency per endpoint.
+Pair with tools/generate_mu_db.py for a reproducible catalog, eg
+    python tools/generate_mu_db.py --series 100000 && python tools/create_mu_db.py
+    python run_server.py
+    python benchmarks/load_test.py --serve-covers --out results.json
+"""
+
+SORTS = [None, "title", "year", "score", "time", "trending", "popularity", "composite"]
+
+### helpers
+
+
+class Workload:
+    """
+    Picks requests. Series ids and tags are drawn with a zipf skew, so a few are hot, like real traffic.
+    """
+
+    def __init__(self, ids: list[int], genres: list[str], categories: list[str]):
+        self.ids = ids
+        self.genres = genres
+        self.categories = categories
+
+        # population size -> zipf cdf
+        self._cdfs: dict[int, np.ndarray] = dict()
+
+    def pick(self, items: list, rng: random.Random, s: float = 1.1):
+        cdf = self._cdfs.get(len(items))
+        if cdf is None:
+            w = 1 / np.arange(1, len(items) + 1) ** s
+            cdf = self._cdfs[len(items)] = np.cumsum(w / w.sum())
+
+        idx = int(np.searchsorted(cdf, rng.random()))
+        return items[min(idx, len(items) - 1)]
+
+    def search(self, rng: random.Random) -> tuple[str, dict]:
+        params = dict()
+        if self.genres and rng.random() < 0.7:
+            params["genres"] = [self.pick(self.genres, rng)]
+            if rng.random() < 0.3:
+                params["genres_exclude"] = [self.pick(self.genres, rng)]
+        if self.categories and rng.random() < 0.3:
+            params["categories"] = [self.pick(self.categories, rng)]
+        if rng.random() < 0.3:
+            params["score_min"] = rng.choice([5, 6, 7, 8])
+        if rng.random() < 0.2:
+            params["year_start_min"] = rng.randint(1980, 2020)
+        if rng.random() < 0.1:
+            params["licensed"] = rng.random() < 0.5
+
+        sort_by = rng.choice(SORTS)
+        if sort_by:
+            params["sort_by"] = sort_by
+            params["ascending"] = rng.random() < 0.5
+        return "/series/search", params
+
+    def series(self, rng: random.Random) -> tuple[str, dict]:
+        return f"/series/ids/{self.pick(self.ids, rng)}", dict()
+
+    def facets(self, rng: random.Random) -> tuple[str, dict]:
+        return rng.choice(["/series/genres", "/series/categories"]), dict()
+
+    def images(self, rng: random.Random) -> tuple[str, dict]:
+        return f"/series/images/{self.pick(self.ids, rng)}", dict()
+
+
+def serve_covers(port: int) -> ThreadingHTTPServer:
+    """
+    Stand-in for the mangaupdates cdn, returns the same small jpeg for every path.
+    """
+
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (250, 350), (200, 120, 80)).save(buf, "JPEG")
+    body = buf.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("content-type", "image/jpeg")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch_targets(base_url: str, max_ids: int) -> Workload:
+    ids = []
+    while len(ids) < max_ids:
+        page = requests.get(
+            f"{base_url}/series/ids",
+            params=dict(offset=len(ids), limit=min(1000, max_ids - len(ids))),
+        ).json()
+        if not page:
+            break
+        ids.extend(page)
+
+    # most used tags first, so the zipf pick favours them
+    genres = requests.get(f"{base_url}/series/genres").json()
+    genres = [g["name"] for g in sorted(genres, key=lambda g: -g["count"])]
+    categories = requests.get(f"{base_url}/series/categories").json()
+    categories = [c[0] for c in sorted(categories, key=lambda c: -c[1])]
+
+    # don't let the hot ids be the lowest ones
+    random.Random(0).shuffle(ids)
+    return Workload(ids, genres, categories)
+
+
+def run(
+    base_url: str,
+    workload: Workload,
+    mix: dict[str, float],
+    duration: float,
+    concurrency: int,
+    seed: int,
+) -> dict[str, list[tuple[float, int]]]:
+    kinds = list(mix.keys())
+    weights = list(mix.values())
+    deadline = time.perf_counter() + duration
+
+    def worker(idx: int) -> dict[str, list[tuple[float, int]]]:
+        rng = random.Random(seed + idx)
+        session = requests.Session()
+        results = defaultdict(list)
+
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            path, params = getattr(workload, kind)(rng)
+
+            start = time.perf_counter()
+            try:
+                resp = session.get(base_url + path, params=params)
+                resp.content
+                status = resp.status_code
+            except requests.RequestException:
+                status = 0
+            results[kind].append((time.perf_counter() - start, status))
+
+        return results
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        per_worker = list(executor.map(worker, range(concurrency)))
+
+    merged = defaultdict(list)
+    for results in per_worker:
+        for kind, xs in results.items():
+            merged[kind].extend(xs)
+    return merged
+
+
+def summarize(results: dict[str, list[tuple[float, int]]], duration: float) -> dict:
+    summary = dict()
+    everything = []
+    for kind, xs in sorted(results.items()) + [("total", None)]:
+        xs = everything if xs is None else xs
+        if kind != "total":
+            everything.extend(xs)
+
+        latencies = np.array([x[0] for x in xs]) * 1000
+        errors = sum(1 for x in xs if not 200 <= x[1] < 400)
+        summary[kind] = dict(
+            requests=len(xs),
+            errors=errors,
+            rps=len(xs) / duration,
+            p50_ms=float(np.percentile(latencies, 50)) if len(xs) else None,
+            p99_ms=float(np.percentile(latencies, 99)) if len(xs) else None,
+        )
+    return summary
+
+
+def print_summary(summary: dict) -> None:
+    print(
+        f"{'':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for kind, s in summary.items():
+        if not s["requests"]:
+            continue
+        print(
+            f"{kind:<10} {s['requests']:>9} {s['errors']:>7} {s['rps']:>8.1f} {s['p50_ms']:>8.1f} {s['p99_ms']:>8.1f}"
+        )
+
+
+### run
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:9999")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-ids", type=int, default=10_000)
+    parser.add_argument(
+        "--mix",
+        default="search=50,series=25,facets=15,images=10",
+        help="relative weight of each request kind",
+    )
+    parser.add_argument(
+        "--serve-covers",
+        type=int,
+        nargs="?",
+        const=9998,
+        help="serve fake covers on this port (the default --image-url of generate_mu_db.py)",
+    )
+    parser.add_argument("--out", type=Path, help="also write the summary as json")
+    args = parser.parse_args()
+
+    mix = {k: float(v) for k, v in (x.split("=") for x in args.mix.split(","))}
+
+    if args.serve_covers:
+        serve_covers(args.serve_covers)
+
+    print(f"Collecting ids and tags from {args.url}...")
+    workload = fetch_targets(args.url, args.max_ids)
+    if not workload.ids:
+        print("No series found, is the db empty?")
+        exit(1)
+    print(
+        f"Found {len(workload.ids)} ids, {len(workload.genres)} genres, {len(workload.categories)} categories"
+    )
+
+    print(f"Running for {args.duration:.0f}s with {args.concurrency} clients...")
+    results = run(args.url, workload, mix, args.duration, args.concurrency, args.seed)
+
+    summary = summarize(results, args.duration)
+    print_summary(summary)
+
+    if args.out:
+        data = dict(
+            time=time.time(),
+            url=args.url,
+            duration=args.duration,
+            concurrency=args.concurrency,
+            mix=mix,
+            summary=summary,
+        )
+        with open(args.out, "w") as file:
+            json.dump(data, file, indent=2)
@@ -1,5 +1,28 @@
+import anyio
+from classes.catalog import (
+    catalog,
+    category_vectors,
+    franchises,
+    prefix_index,
+    recommendations,
+    relations,
+    tag_index,
+)
+from classes.library import derivatives, page_cache, readahead
+from classes.models import sql_hooks
+from classes.settings import Settings
+from config import paths
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from utils.db_maintenance import MaintenanceJob, QueryShapes
+from utils.metrics import record_sql
+from utils.profiling import SlowQueryLog
+
+from .admission import DEFAULT_POOLS, DEFAULT_ROUTES, AdmissionMiddleware
+from .covers import sprites
+from .middleware import MetricsMiddleware
+
+settings = Settings.load()
 
 app = FastAPI(debug=True)
 
@@ -12,4 +35,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from . import routes
+# per route concurrency limits, inside the metrics middleware so rejected requests are counted
+admission_pools = {
+    name: DEFAULT_POOLS.get(name, dict()) | settings.admission_pools.get(name, dict())
+    for name in DEFAULT_POOLS.keys() | settings.admission_pools.keys()
+}
+admission_routes = DEFAULT_ROUTES | settings.admission_routes
+app.add_middleware(AdmissionMiddleware, pools=admission_pools, routes=admission_routes)
+app.add_middleware(MetricsMiddleware)
+sql_hooks.append(record_sql)
+
+slow_queries = None
+if settings.slow_query_ms > 0:
+    slow_queries = SlowQueryLog(paths.DB_FILE, settings.slow_query_ms / 1000)
+    sql_hooks.append(slow_queries)
+
+db_maintenance = None
+if settings.db_maintenance_hours > 0:
+    query_shapes = QueryShapes()
+    sql_hooks.append(query_shapes)
+    db_maintenance = MaintenanceJob(
+        paths.DB_FILE, query_shapes, settings.db_maintenance_hours * 60 * 60
+    )
+
+# apply library settings
+derivatives.max_bytes = settings.derivative_cache_mb * 1024**2
+derivatives.workers = settings.derivative_workers
+page_cache.max_bytes = settings.page_cache_mb * 1024**2
+readahead.pages = settings.readahead_pages
+readahead.next_chapter_pages = settings.readahead_next_chapter_pages
+sprites.max_bytes = settings.sprite_cache_mb * 1024**2
+
+
+@app.on_event("startup")
+def size_threadpool():
+    # sync routes run in anyio's shared threadpool, make sure it can fit every pool at once
+    # (plus a few threads for the unlimited routes) or the pools would still starve each other
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    concurrency = sum(p["concurrency"] for p in admission_pools.values())
+    limiter.total_tokens = max(limiter.total_tokens, concurrency + 8)
+
+
+@app.on_event("startup")
+def load_catalog():
+    if settings.catalog:
+        catalog.enable()
+    else:
+        tag_index.enable()
+
+    recommendations.enable()
+    relations.enable()
+    franchises.enable()
+    category_vectors.enable()
+    prefix_index.enable()
+
+    if db_maintenance is not None:
+        db_maintenance.start()
+
+
+from . import admin_routes, browse_routes, library_routes, routes
@@ -0,0 +1,53 @@
+import hmac
+import threading
+
+from fastapi import Depends, Header, HTTPException, Query
+from utils.profiling import SamplingProfiler
+
+from . import app, db_maintenance, settings, slow_queries
+
+# only one profile at a time, overlapping samplers would just measure each other
+profile_lock = threading.Lock()
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    if not settings.admin_token:
+        raise HTTPException(404)
+    if not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(403)
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+def profile(
+    seconds: float = Query(default=10, gt=0, le=120),
+    interval_ms: float = Query(default=5, ge=1, le=1000),
+):
+    """
+    Sample every thread of this worker for [seconds] and return a speedscope profile.
+    """
+
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(409, "A profile is already running")
+
+    try:
+        return SamplingProfiler(interval_ms / 1000).run(seconds)
+    finally:
+        profile_lock.release()
+
+
+@app.get("/admin/slow-queries", dependencies=[Depends(require_admin)])
+def get_slow_queries():
+    if slow_queries is None:
+        return []
+    return list(reversed(slow_queries.entries))
+
+
+@app.get("/admin/db", dependencies=[Depends(require_admin)])
+def get_db_report():
+    """
+    Size / fragmentation of the db and suggested indexes, as of the last maintenance run.
+    """
+
+    if db_maintenance is None:
+        raise HTTPException(404, "Db maintenance is disabled")
+    return db_maintenance.report()
@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from dataclasses import dataclass
+
+from starlette.responses import PlainTextResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+from utils.metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT,
+)
+
+# request priorities, lower is served first
+INTERACTIVE = 0
+BULK = 1
+
+# name -> settings, overridden by settings.admission_pools
+DEFAULT_POOLS = {
+    # cheap lookups by id, the reader / series pages wait on these
+    "lookup": dict(concurrency=16, queue=256, timeout=2),
+    "search": dict(concurrency=8, queue=64, timeout=5),
+    # first fetch of a cover blocks on mangaupdates
+    "covers": dict(concurrency=8, queue=64, timeout=10),
+    "pages": dict(concurrency=16, queue=256, timeout=10),
+    "default": dict(concurrency=8, queue=64, timeout=5),
+}
+
+# route template -> pool, overridden by settings.admission_routes. An empty pool means the route is never limited.
+# Routes not listed here use the default pool.
+DEFAULT_ROUTES = {
+    "/series/ids/{id}": "lookup",
+    "/series/ids/{id}/related": "lookup",
+    "/series/ids/{id}/franchise": "lookup",
+    "/series/ids/{id}/recommendations": "lookup",
+    "/series/ids/{id}/chapters": "lookup",
+    "/series/match": "lookup",
+    "/series/suggest": "lookup",
+    "/series/genres": "lookup",
+    "/series/categories": "lookup",
+    "/chapters/{id}": "lookup",
+    "/authors": "lookup",
+    "/authors/{id}": "lookup",
+    "/publishers": "lookup",
+    "/publishers/{id}": "lookup",
+    "/series/search": "search",
+    "/series/ids/{id}/similar": "search",
+    "/series/ids": "search",
+    "/series/images/{id}": "covers",
+    "/series/sprites": "covers",
+    "/series/sprites/{key}.jpg": "lookup",
+    "/chapters/{id}/pages/{page}": "pages",
+    "/chapters/{id}/pages/{page}/thumbnail": "pages",
+    "/metrics": "",
+    "/admin/profile": "",
+    "/admin/slow-queries": "",
+    "/admin/db": "",
+}
+
+# routes whose requests are always bulk, in addition to ndjson exports
+BULK_ROUTES = ["/series/ids"]
+
+
+@dataclass
+class Waiter:
+    priority: int
+    seq: int
+    future: asyncio.Future
+
+    def __lt__(self, other: "Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Pool:
+    """
+    Concurrency limit for a group of routes, with a bounded queue.
+    Queued requests are admitted by priority, then arrival. When the queue is full a new request displaces
+    the newest waiter of a lower priority, if there is one, and is rejected otherwise.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        # max seconds a request waits for a slot
+        self.timeout = timeout
+
+        self.active = 0
+        self._waiters: list[Waiter] = []
+        self._seq = itertools.count()
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.timeout))
+
+    async def acquire(self, priority: int) -> str | None:
+        """
+        Take a slot, waiting if needed. Returns None once admitted, or why the request was rejected.
+        """
+
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return None
+
+        if len(self._waiters) >= self.queue:
+            worst = max(self._waiters, default=None)
+            if worst is None or worst.priority <= priority:
+                return "queue_full"
+            self._remove(worst)
+            worst.future.set_result("displaced")
+
+        waiter = Waiter(
+            priority, next(self._seq), asyncio.get_running_loop().create_future()
+        )
+        heapq.heappush(self._waiters, waiter)
+        ADMISSION_QUEUED.inc(pool=self.name)
+
+        try:
+            await asyncio.wait([waiter.future], timeout=self.timeout)
+        except BaseException:
+            # client went away while queued, give back the slot if it was just handed over
+            if waiter.future.done():
+                if waiter.future.result() is None:
+                    self.release()
+            else:
+                self._remove(waiter)
+            raise
+
+        if waiter.future.done():
+            return waiter.future.result()
+
+        self._remove(waiter)
+        waiter.future.cancel()
+        return "timeout"
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            ADMISSION_QUEUED.dec(pool=self.name)
+            if not waiter.future.done():
+                # hand the slot straight over, active stays the same
+                waiter.future.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove(self, waiter: Waiter) -> None:
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            ADMISSION_QUEUED.dec(pool=self.name)
+
+
+class AdmissionMiddleware:
+    """
+    Limits how many requests each pool of routes runs at once, so a burst of searches or slow cover downloads
+    can't take every worker thread from cheap lookups. Requests over the limit queue briefly, and are turned away
+    with a 503 + Retry-After once the queue is full or they've waited too long.
+    Bulk requests (ndjson exports, paging through every id) queue behind interactive ones and are shed first.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        pools: dict[str, dict],
+        routes: dict[str, str],
+    ):
+        self.app = app
+        self.pools = {name: Pool(name, **kwargs) for name, kwargs in pools.items()}
+        self.routes = routes
+
+    def match(self, scope: Scope) -> str | None:
+        """
+        Template of the route the router will pick, eg /series/ids/{id}.
+        """
+
+        for route in scope["app"].router.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                # lets MetricsMiddleware label rejected requests too
+                scope["route"] = child_scope.get("route", route)
+                return route.path
+        return None
+
+    def priority(self, scope: Scope, path: str) -> int:
+        if path in BULK_ROUTES:
+            return BULK
+        for name, value in scope["headers"]:
+            if name == b"accept" and b"application/x-ndjson" in value:
+                return BULK
+        return INTERACTIVE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = self.match(scope)
+        pool = self.pools.get(self.routes.get(path, "default"))
+        if path is None or pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        rejected = await pool.acquire(self.priority(scope, path))
+        ADMISSION_WAIT.observe(time.perf_counter() - start, pool=pool.name)
+
+        if rejected is not None:
+            ADMISSION_REJECTED.inc(pool=pool.name, reason=rejected)
+            response = PlainTextResponse(
+                "Server busy, retry later",
+                503,
+                headers={"retry-after": str(pool.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        ADMISSION_ACTIVE.inc(pool=pool.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ADMISSION_ACTIVE.dec(pool=pool.name)
+            pool.release()
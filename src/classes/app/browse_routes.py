@@ -0,0 +1,128 @@
+from classes.catalog.prefix_index import MAX_CHAR
+from classes.models import db
+from fastapi import HTTPException
+from pony import orm
+from utils.text import normalize_title
+
+from . import app
+
+# name lookups return at most this many matches
+MAX_MATCHES = 50
+
+
+def sort_works(works: list[dict], sort_by: str, ascending: bool) -> list[dict]:
+    """
+    Sort by [sort_by], series without a value (eg no year) go last either way.
+    """
+
+    fields = {"score": "bayesian_rating", "year": "year", "title": "title"}
+    if sort_by not in fields:
+        raise HTTPException(400, f"Unknown sort [{sort_by}], expected {list(fields)}")
+
+    field = fields[sort_by]
+    known = [w for w in works if w[field] is not None]
+    unknown = [w for w in works if w[field] is None]
+    return sorted(known, key=lambda w: w[field], reverse=not ascending) + unknown
+
+
+def group_roles(rows: list[tuple]) -> list[dict]:
+    """
+    (series id, title, year, rating, role) rows -> one entry per series with every role, eg author + artist.
+    """
+
+    keys = ["id", "title", "year", "bayesian_rating"]
+    works = dict()
+    for *series, role in rows:
+        work = works.setdefault(series[0], dict(zip(keys, series), roles=[]))
+        work["roles"].append(role)
+    return list(works.values())
+
+
+def find_by_name(entity: str, name: str) -> list[dict]:
+    """
+    Authors / publishers whose normalized name starts with the normalized [name], exact matches first.
+    A range on the normalized index, so it stays cheap however many there are.
+    """
+
+    normalized = normalize_title(name)
+    if not normalized:
+        return []
+
+    with orm.db_session:
+        result = orm.select(
+            (x.id, x.name, x.normalized)
+            for x in db.entities[entity]
+            if x.normalized >= normalized and x.normalized < normalized + MAX_CHAR
+        ).order_by(3)[:MAX_MATCHES]
+
+    keys = ["id", "name"]
+    result = sorted(result, key=lambda r: r[2] != normalized)
+    return [dict(zip(keys, r)) for r in result]
+
+
+@app.get("/authors")
+def get_authors(name: str):
+    return find_by_name("Author", name)
+
+
+@app.get("/authors/{id}")
+def get_author(id: int, sort_by: str = "score", ascending: bool = False):
+    """
+    An author and every series they worked on, in one lookup on the (author, series) index.
+    """
+
+    with orm.db_session:
+        author = db.entities["Author"].get(id=id)
+        if author is None:
+            raise HTTPException(404)
+
+        rows = orm.select(
+            (
+                a.series.id,
+                a.series.name,
+                a.series.year,
+                a.series.bayesian_rating,
+                a.type.name,
+            )
+            for a in db.entities["SeriesAuthor"]
+            if a.author == author
+        ).without_distinct()[:]
+
+        resp = dict(id=author.id, name=author.name)
+
+    resp["series"] = sort_works(group_roles(rows), sort_by, ascending)
+    return resp
+
+
+@app.get("/publishers")
+def get_publishers(name: str):
+    return find_by_name("Publisher", name)
+
+
+@app.get("/publishers/{id}")
+def get_publisher(id: int, sort_by: str = "score", ascending: bool = False):
+    """
+    A publisher and every series they publish, in one lookup on the (publisher, series) index.
+    """
+
+    with orm.db_session:
+        publisher = db.entities["Publisher"].get(id=id)
+        if publisher is None:
+            raise HTTPException(404)
+
+        rows = orm.select(
+            (
+                p.series.id,
+                p.series.name,
+                p.series.year,
+                p.series.bayesian_rating,
+                p.publisher_type.name,
+            )
+            for p in db.entities["SeriesPublisher"]
+            if p.publisher == publisher
+        ).without_distinct()[:]
+
+        resp = dict(id=publisher.id, name=publisher.name)
+
+    resp["series"] = sort_works(group_roles(rows), sort_by, ascending)
+    return resp
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+import urlpath
+from classes.models import db
+from config import paths
+from pony import orm
+from utils.coalesce import SingleFlight
+from utils.data_version import current_data_version
+from utils.metrics import CACHE_REQUESTS
+
+# cells are cover shaped, width x round(width * COVER_RATIO)
+COVER_RATIO = 1.4
+SPRITE_COLUMNS = 10
+# parallel cover downloads while building a sheet
+FETCH_WORKERS = 4
+
+cover_flight = SingleFlight("cover")
+sprite_flight = SingleFlight("sprite")
+
+
+def cover_urls(ids: list[int]) -> dict[int, urlpath.URL]:
+    with orm.db_session:
+        result = orm.select(
+            (s.id, s.cover.original)
+            for s in db.entities["Series"]
+            if s.id in ids and s.cover is not None
+        )[:]
+
+    return {id: urlpath.URL(url) for id, url in result if url}
+
+
+def cover_file(url: urlpath.URL) -> Path:
+    """
+    Local copy of a cover, downloaded on first use.
+    """
+
+    file = paths.COVER_DIR / url.parts[-1]
+    if file.exists():
+        CACHE_REQUESTS.inc(cache="cover", result="hit")
+    else:
+        CACHE_REQUESTS.inc(cache="cover", result="miss")
+        cover_flight.do(file, lambda: fetch_cover(url, file))
+    return file
+
+
+def temp_path(file: Path) -> Path:
+    return file.with_name(f"{file.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+
+
+def fetch_cover(url: urlpath.URL, file: Path) -> None:
+    logging.info(f"fetching image [{url}]")
+    content = requests.get(url).content
+
+    # written aside and moved into place, so a concurrent request never serves a partial file
+    # (the name is unique per writer, other server workers may be fetching the same cover)
+    tmp_file = temp_path(file)
+    tmp_file.write_bytes(content)
+    tmp_file.replace(file)
+
+
+class SpriteCache:
+    """
+    Cover thumbnails for a list of series packed into one jpeg, plus a map of where each cover is,
+    so a grid page costs one image request instead of one per series.
+    Sheets are keyed by a hash of the ids, width and data version, and the least recently used are evicted
+    once the cache dir grows past max_bytes.
+    A sheet is only cached when every cover could be fetched. Otherwise it's written under a one-off partial key
+    (see is_partial) that's never handed out again, so the next request retries the failed covers and a cached
+    key always means the same bytes.
+    """
+
+    quality = 80
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 256 * 1024**2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._size: int | None = None
+        self._evicting = False
+
+    def key(self, ids: list[int], width: int) -> str:
+        # a new import can change covers, so the version is part of the key and old sheets just age out
+        data = f"{current_data_version()}:{width}:{','.join(map(str, ids))}"
+        return hashlib.sha1(data.encode()).hexdigest()[:20]
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.jpg"
+
+    @staticmethod
+    def is_partial(key: str) -> bool:
+        return "-" in key
+
+    def get(self, ids: list[int], width: int) -> dict:
+        """
+        Coordinate map of the sheet for [ids], building it if needed.
+        """
+
+        key = self.key(ids, width)
+        meta_file = self.path_for(key).with_suffix(".json")
+
+        try:
+            meta = json.loads(meta_file.read_text())
+        except FileNotFoundError:
+            CACHE_REQUESTS.inc(cache="sprite", result="miss")
+            return sprite_flight.do(key, lambda: self.build(key, ids, width))
+
+        CACHE_REQUESTS.inc(cache="sprite", result="hit")
+        # bump mtime so eviction treats this as recently used
+        for f in [meta_file, self.path_for(key)]:
+            try:
+                os.utime(f)
+            except FileNotFoundError:
+                pass
+        return meta
+
+    def build(self, key: str, ids: list[int], width: int) -> dict:
+        from PIL import Image, ImageOps
+
+        height = round(width * COVER_RATIO)
+        columns = min(len(ids), SPRITE_COLUMNS)
+        rows = -(-len(ids) // SPRITE_COLUMNS)
+
+        urls = cover_urls(ids)
+        with ThreadPoolExecutor(FETCH_WORKERS) as executor:
+            files = dict(zip(urls, executor.map(self._fetch, urls.values())))
+
+        sheet = Image.new("RGB", (columns * width, rows * height), "white")
+        cells = dict()
+        missing = []
+        failed = False
+        for i, id in enumerate(ids):
+            x, y = (i % SPRITE_COLUMNS) * width, (i // SPRITE_COLUMNS) * height
+            if id not in urls:
+                # no cover at all, the same every time
+                missing.append(id)
+                continue
+
+            try:
+                if files[id] is None:
+                    raise FileNotFoundError(urls[id])
+                with Image.open(files[id]) as im:
+                    im.draft("RGB", (width, height))
+                    im = ImageOps.fit(im.convert("RGB"), (width, height), Image.LANCZOS)
+                    sheet.paste(im, (x, y))
+            except Exception:
+                # eg mangaupdates timing out, may work next time
+                failed = True
+                missing.append(id)
+                continue
+            cells[id] = [x, y, width, height]
+
+        if failed:
+            key = f"{key}-{uuid.uuid4().hex[:8]}"
+        file = self.path_for(key)
+        meta = dict(
+            url=f"/series/sprites/{key}.jpg",
+            width=sheet.width,
+            height=sheet.height,
+            cells=cells,
+            missing=missing,
+        )
+
+        tmp_file = temp_path(file)
+        sheet.save(tmp_file, "JPEG", quality=self.quality, optimize=True)
+        os.replace(tmp_file, file)
+        size = file.stat().st_size
+
+        if not failed:
+            # map last, its presence means the sheet is complete
+            meta_file = file.with_suffix(".json")
+            tmp_file = temp_path(meta_file)
+            tmp_file.write_text(json.dumps(meta))
+            os.replace(tmp_file, meta_file)
+            size += meta_file.stat().st_size
+
+        self._on_built(size)
+
+        # same shape as a cache hit (json object keys are strings)
+        meta["cells"] = {str(id): cell for id, cell in cells.items()}
+        return meta
+
+    def _fetch(self, url: urlpath.URL) -> Path | None:
+        try:
+            return cover_file(url)
+        except Exception:
+            logging.exception(f"Failed to fetch cover [{url}]")
+            return None
+
+    def _on_built(self, size: int) -> None:
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+
+            over = self._size is None or self._size > self.max_bytes
+            if over and not self._evicting:
+                self._evicting = True
+                threading.Thread(target=self.evict, daemon=True).start()
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used sheets until the cache fits in max_bytes.
+        """
+
+        try:
+            self._evict()
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _evict(self) -> None:
+        sheets = []
+        for f in self.cache_dir.glob("*.jpg"):
+            meta_file = f.with_suffix(".json")
+            try:
+                stat = f.stat()
+            except FileNotFoundError:
+                continue
+            # the map can already be gone, mid build or evict
+            file_size = stat.st_size
+            if meta_file.exists():
+                file_size += meta_file.stat().st_size
+            sheets.append((stat.st_mtime, file_size, f, meta_file))
+
+        size = sum(x[1] for x in sheets)
+        if size > self.max_bytes:
+            sheets.sort()
+            # overshoot a little so we're not evicting on every build
+            target = self.max_bytes * 0.9
+            for _, file_size, f, meta_file in sheets:
+                if size <= target:
+                    break
+                # map first, so a concurrent get() rebuilds instead of pointing at a missing sheet
+                meta_file.unlink(missing_ok=True)
+                f.unlink(missing_ok=True)
+                size -= file_size
+            logging.info(f"Evicted sprite sheets down to {size / 1024**2:.0f}MB")
+
+        with self._lock:
+            self._size = size
+
+
+sprites = SpriteCache(paths.SPRITE_DIR)
@@ -0,0 +1,97 @@
+import asyncio
+from pathlib import Path
+
+import anyio
+from classes.library import (
+    THUMBNAIL_WIDTH,
+    bucket_width,
+    derivatives,
+    library,
+    page_cache,
+    readahead,
+)
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import FileResponse
+
+from . import app
+from .responses import ArchivePageResponse
+
+
+@app.get("/series/ids/{id}/chapters")
+def get_chapters(id: int):
+    chapters = library.chapters(id)
+
+    keys = ["id", "name"]
+    return [dict(zip(keys, [c.id, c.name])) for c in chapters]
+
+
+@app.get("/chapters/{id}")
+def get_chapter(id: int):
+    chapter = library.chapter(id)
+    if chapter is None:
+        raise HTTPException(404)
+
+    pages = library.pages(chapter)
+    if pages is None:
+        raise HTTPException(404)
+    next_chapter = library.next_chapter(chapter)
+
+    return dict(
+        id=chapter.id,
+        name=chapter.name,
+        pages=[p.name for p in pages],
+        next=next_chapter.id if next_chapter else None,
+    )
+
+
+def find_page(id: int, page: int):
+    chapter = library.chapter(id)
+    if chapter is None:
+        raise HTTPException(404)
+
+    pages = library.pages(chapter)
+    if pages is None or not 0 <= page < len(pages):
+        raise HTTPException(404)
+
+    return chapter, pages[page]
+
+
+async def get_derivative(chapter, page: int, entry, width: int) -> FileResponse:
+    # get() stats / touches files, keep that off the event loop
+    future = await anyio.to_thread.run_sync(
+        derivatives.get, chapter, page, entry, width
+    )
+    file = await asyncio.wrap_future(future)
+    return FileResponse(file, headers={"cache-control": "public, max-age=86400"})
+
+
+@app.get("/chapters/{id}/pages/{page}/thumbnail")
+async def get_thumbnail(id: int, page: int):
+    chapter, entry = await anyio.to_thread.run_sync(find_page, id, page)
+    return await get_derivative(chapter, page, entry, THUMBNAIL_WIDTH)
+
+
+@app.get("/chapters/{id}/pages/{page}")
+async def get_page(
+    id: int,
+    page: int,
+    request: Request,
+    width: int | None = Query(default=None, ge=1),
+):
+    chapter, entry = await anyio.to_thread.run_sync(find_page, id, page)
+
+    readahead.schedule(chapter, page)
+
+    if width is not None:
+        return await get_derivative(chapter, page, entry, bucket_width(width))
+
+    return ArchivePageResponse(
+        Path(chapter.path),
+        entry,
+        range_header=request.headers.get("range"),
+        headers={
+            "cache-control": "public, max-age=86400",
+            "etag": f'"{chapter.id}-{chapter.mtime}-{page}"',
+        },
+        data=page_cache.get((chapter.id, chapter.mtime, page)),
+    )
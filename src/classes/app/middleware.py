@@ -0,0 +1,46 @@
+import time
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+from utils.metrics import (
+    REQUEST_LATENCY,
+    REQUEST_SQL_COUNT,
+    REQUEST_SQL_TIME,
+    REQUESTS_IN_FLIGHT,
+    RequestStats,
+    current_request,
+)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, in-flight count and sql usage of every http request.
+    Requests are labelled with the route template (eg /series/ids/{id}) rather than the raw path,
+    so the number of series doesn't blow up the label count.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(route="", scope=scope)
+        token = current_request.set(stats)
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            current_request.reset(token)
+
+            # the router adds the matched route to the scope
+            route = scope.get("route")
+            stats.route = getattr(route, "path", "unmatched")
+
+            REQUEST_LATENCY.observe(elapsed, route=stats.route)
+            REQUEST_SQL_COUNT.observe(stats.sql_count, route=stats.route)
+            REQUEST_SQL_TIME.observe(stats.sql_time, route=stats.route)
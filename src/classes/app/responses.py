@@ -0,0 +1,172 @@
+import mimetypes
+import os
+from pathlib import Path
+
+import anyio
+from classes.library import ArchiveEntry, read_entry
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single "bytes=start-end" range into an inclusive (start, end) pair.
+    Returns None when the whole body should be sent.
+    """
+
+    if not header or not header.startswith("bytes="):
+        return None
+
+    spec = header[len("bytes=") :].strip()
+    if "," in spec:
+        # multipart ranges aren't worth it for images, send everything
+        return None
+
+    start, _, end = spec.partition("-")
+    try:
+        if start == "":
+            # suffix range, ie the last n bytes
+            length = int(end)
+            if length <= 0:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+class ArchivePageResponse(Response):
+    """
+    Serve one page of a zip, optionally a byte range of it.
+    Stored entries are sent straight from the archive file (zero-copy when the server supports it),
+    deflated entries are inflated off the event loop.
+    If the page is already in memory (eg from read-ahead), pass it as [data] to skip the archive.
+    """
+
+    def __init__(
+        self,
+        file: Path,
+        entry: ArchiveEntry,
+        range_header: str = None,
+        headers: dict = None,
+        background: BackgroundTask = None,
+        data: bytes = None,
+    ):
+        self.file = file
+        self.entry = entry
+        self.data = data
+        self.background = background
+
+        self.status_code = 200
+        self.range = None
+        try:
+            self.range = parse_range(range_header, entry.file_size)
+        except RangeNotSatisfiable:
+            self.status_code = 416
+
+        media_type = mimetypes.guess_type(entry.name)[0] or "application/octet-stream"
+        self.init_headers(
+            {
+                "accept-ranges": "bytes",
+                "content-type": media_type,
+                **(headers or {}),
+            }
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        size = self.entry.file_size
+
+        if self.status_code == 416:
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            await send(self._start())
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        start, end = self.range or (0, size - 1)
+        if self.range is not None:
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+
+        await send(self._start())
+        if scope["method"] != "HEAD":
+            if self.data is not None:
+                await send(
+                    {"type": "http.response.body", "body": self.data[start : end + 1]}
+                )
+            elif self.entry.is_stored:
+                await self._send_file(
+                    scope, send, self.entry.data_offset + start, end - start + 1
+                )
+            else:
+                data = await anyio.to_thread.run_sync(read_entry, self.file, self.entry)
+                await send(
+                    {"type": "http.response.body", "body": data[start : end + 1]}
+                )
+        else:
+            await send({"type": "http.response.body", "body": b""})
+
+        if self.background is not None:
+            await self.background()
+
+    def _start(self) -> dict:
+        return {
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        }
+
+    async def _send_file(self, scope: Scope, send: Send, offset: int, count: int):
+        f = await anyio.to_thread.run_sync(open, self.file, "rb", 0)
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                # the extension takes a file object, not a bare fd
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": f,
+                        "offset": offset,
+                        "count": count,
+                        "more_body": False,
+                    }
+                )
+                return
+
+            more_body = True
+            while count > 0:
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, f.fileno(), min(CHUNK_SIZE, count), offset
+                )
+                if not chunk:
+                    # archive shrank under us
+                    break
+
+                offset += len(chunk)
+                count -= len(chunk)
+                more_body = count > 0
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": more_body,
+                    }
+                )
+
+            if more_body:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            f.close()
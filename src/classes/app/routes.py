@@ -1,18 +1,84 @@
-import logging
+import re
 
-import requests
 import urlpath
+from classes.catalog import (
+    catalog,
+    category_vectors,
+    franchises,
+    prefix_index,
+    recommendations,
+    relations,
+    tag_index,
+)
+from classes.catalog.graph import DEFAULT_WEIGHTS
 from classes.models import db
-from config import paths
-from fastapi import HTTPException, Query
-from fastapi.responses import FileResponse
+from classes.models.lookups import match_series_ids
+from fastapi import Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
 from pony import orm
+from utils.coalesce import SingleFlight, request_key
+from utils.metrics import REGISTRY
+from utils.text import normalize_title
 
 from . import app
+from .covers import cover_file, sprites
+from .streaming import (
+    check_fields,
+    chunked,
+    iter_query,
+    ndjson_response,
+    wants_ndjson,
+)
+
+# max number of ids to inline into an sql IN (...) clause
+SQL_MAX_IDS = 500
+
+SPRITE_MAX_IDS = 100
+# fixed so different clients share sheets
+SPRITE_WIDTHS = [60, 120, 200]
+# the hash, plus a suffix for partial sheets
+SPRITE_KEY_PATT = re.compile(r"[0-9a-f]{20}(-[0-9a-f]{8})?")
+
+search_flight = SingleFlight("search")
+facets_flight = SingleFlight("facets")
+
+
+def get_tag_index():
+    cat = catalog.get()
+    if cat is not None:
+        return cat.tags
+    return tag_index.get()
+
+
+def series_exists(id: int) -> bool:
+    cat = catalog.get()
+    if cat is not None:
+        return cat.row(id) is not None
+
+    with orm.db_session:
+        return db.entities["Series"].exists(id=id)
 
 
 @app.get("/series/ids")
-def get_ids(offset: int = 0, limit: int = 100):
+def get_ids(
+    offset: int = 0,
+    limit: int = None,
+    fields: list[str] = Query(None),
+    accept: str = Header(default=""),
+):
+    """
+    With Accept: application/x-ndjson, streams every id (from [offset], up to [limit] if given),
+    optionally with [fields] of each series. Otherwise returns a page of [limit] (default 100) ids.
+    """
+
+    if wants_ndjson(accept):
+        fields = check_fields(fields)
+        with orm.db_session:
+            query = orm.select(s.id for s in db.entities["Series"])
+            chunks = iter_query(query, limit=limit, offset=offset or None)
+        return ndjson_response(chunks, fields)
+
+    limit = 100 if limit is None else limit
     with orm.db_session:
         result = orm.select(s.id for s in db.entities["Series"])[
             offset : offset + limit
@@ -82,6 +148,65 @@ def get_series(id: int):
     return resp
 
 
+@app.get("/series/ids/{id}/recommendations")
+def get_recommendations(
+    id: int,
+    limit: int = Query(default=20, ge=1, le=100),
+    user_weight: float = None,
+    category_weight: float = None,
+    shared_weight: float = None,
+):
+    graph = recommendations.get()
+    if graph is None:
+        raise HTTPException(503)
+    # series without recommendations aren't in the graph, so check the id separately
+    if not series_exists(id):
+        raise HTTPException(404)
+
+    weights = None
+    if any(x is not None for x in [user_weight, category_weight, shared_weight]):
+        weights = [
+            x if x is not None else default
+            for x, default in zip(
+                [user_weight, category_weight, shared_weight], DEFAULT_WEIGHTS
+            )
+        ]
+
+    keys = ["id", "score"]
+    return [dict(zip(keys, r)) for r in graph.top(id, limit, weights)]
+
+
+@app.get("/series/ids/{id}/related")
+def get_related(id: int):
+    graph = relations.get()
+    if graph is None:
+        raise HTTPException(503)
+    if not series_exists(id):
+        raise HTTPException(404)
+
+    keys = ["id", "type"]
+    return [dict(zip(keys, r)) for r in graph.related(id)]
+
+
+@app.get("/series/ids/{id}/franchise")
+def get_franchise(id: int):
+    """
+    Every series connected to [id] by relations, main story / sequels first then adaptations and side stories,
+    each by year. [relation] is how the series relates to the rest (None for the original).
+    """
+
+    index = franchises.get()
+    if index is None:
+        raise HTTPException(503)
+    # series without relations aren't in the index, so it can't tell them apart from unknown ids
+    if not series_exists(id):
+        raise HTTPException(404)
+
+    franchise_id, members = index.franchise(id)
+    keys = ["id", "relation"]
+    return dict(id=franchise_id, series=[dict(zip(keys, m)) for m in members])
+
+
 @app.get("/series/images/{id}")
 def get_image(id: int):
     with orm.db_session:
@@ -92,32 +217,75 @@ def get_image(id: int):
     if len(result) == 0:
         return HTTPException(404)
 
-    url = urlpath.URL(result[0])
-    file = paths.COVER_DIR / url.parts[-1]
+    return FileResponse(cover_file(urlpath.URL(result[0])))
+
+
+@app.get("/series/sprites")
+def get_sprites(ids: list[int] = Query(), width: int = 120):
+    """
+    One sheet of cover thumbnails for [ids] (eg a page of search results), with where each cover is on it.
+    The sheet itself is at the returned url, which never changes content so it can be cached forever.
+    """
+
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > SPRITE_MAX_IDS:
+        raise HTTPException(400, f"At most {SPRITE_MAX_IDS} ids per sheet")
+    if width not in SPRITE_WIDTHS:
+        raise HTTPException(400, f"Unknown width [{width}], expected {SPRITE_WIDTHS}")
+
+    return sprites.get(ids, width)
+
+
+@app.get("/series/sprites/{key}.jpg")
+def get_sprite_sheet(key: str):
+    if not SPRITE_KEY_PATT.fullmatch(key):
+        raise HTTPException(404)
+
+    file = sprites.path_for(key)
     if not file.exists():
-        with open(file, "wb") as f:
-            logging.info(f"fetching image [{url}]")
-            content = requests.get(url).content
-            f.write(content)
+        # evicted, the client should ask for the map again
+        raise HTTPException(404)
 
-    return FileResponse(file)
+    if sprites.is_partial(key):
+        # missing some covers, the next map request will point at a better sheet
+        cache_control = "no-cache"
+    else:
+        cache_control = "public, max-age=31536000, immutable"
+    return FileResponse(file, headers={"cache-control": cache_control})
 
 
 @app.get("/series/genres")
 def get_genres():
+    return facets_flight.do("genres", genre_counts)
+
+
+def genre_counts():
+    tags = get_tag_index()
+    if tags is not None:
+        keys = ["name", "count"]
+        return [dict(zip(keys, r)) for r in tags.genre_counts()]
+
     with orm.db_session:
         result = orm.select(
             [g.name, len(s.name for s in g.series)] for g in db.entities["Genre"]
         )[:]
 
     keys = ["name", "count"]
-    resp = [zip(keys, r) for r in result]
+    resp = [dict(zip(keys, r)) for r in result]
 
     return resp
 
 
 @app.get("/series/categories")
 def get_categories(count_min: int = 101):
+    return facets_flight.do("categories", category_counts)
+
+
+def category_counts():
+    tags = get_tag_index()
+    if tags is not None:
+        return tags.category_counts()
+
     with orm.db_session:
         result = orm.select(
             [c.name, len(c.series_categories)] for c in db.entities["CategoryType"]
@@ -125,6 +293,58 @@ def get_categories(count_min: int = 101):
     return result
 
 
+def filter_title(result, title: str):
+    if title is None:
+        return result
+
+    # a substring match on every word, so this scans Title.normalized rather than using its index
+    # (the index serves exact lookups, see /series/match)
+    temp = db.entities["Title"]
+    for word in normalize_title(title).split(" "):
+        temp = orm.select(t for t in temp if word in t.normalized)
+    temp = orm.select(t.series for t in temp)
+    return orm.select(s for s in result if s in temp)
+
+
+def filter_author(result, author: str):
+    if author is None:
+        return result
+
+    # same normalization as titles, so accents / full-width / non-ascii case match too
+    words = normalize_title(author).split()
+    if not words:
+        return result
+
+    temp = db.entities["Author"]
+    for word in words:
+        temp = orm.select(a for a in temp if word in a.normalized)
+    temp = orm.select(sa.series for sa in db.entities["SeriesAuthor"] if sa.author in temp)
+    return orm.select(s for s in result if s in temp)
+
+
+@app.get("/series/match")
+def get_match(name: str):
+    """
+    Ids of the series with a title equal to [name] after normalization (eg a library folder name).
+    """
+
+    with orm.db_session:
+        return match_series_ids(name)
+
+
+@app.get("/series/suggest")
+def get_suggestions(q: str, limit: int = Query(default=10, ge=1, le=100)):
+    """
+    Typeahead matches for a title / author prefix, as [id, title] pairs.
+    """
+
+    index = prefix_index.get()
+    if index is None:
+        raise HTTPException(503)
+
+    return index.suggest(q, limit)
+
+
 @app.get("/series/search")
 def get_search(
     title: str = None,
@@ -140,35 +360,114 @@ def get_search(
     categories_exclude: list[str] = Query(None),
     sort_by: str = None,
     ascending: bool = True,
+    collapse_franchises: bool = False,
+    fields: list[str] = Query(None),
+    accept: str = Header(default=""),
+):
+    """
+    Ids of the matching series, sorted. With Accept: application/x-ndjson the ids are streamed one per line
+    instead, optionally with [fields] of each series.
+    [collapse_franchises] keeps only the first (best sorted) series of each franchise.
+    """
+
+    params = dict(
+        title=title,
+        author=author,
+        year_start_min=year_start_min,
+        year_start_max=year_start_max,
+        score_min=score_min,
+        licensed=licensed,
+        completed=completed,
+        genres=genres,
+        genres_exclude=genres_exclude,
+        categories=categories,
+        categories_exclude=categories_exclude,
+        sort_by=sort_by,
+        ascending=ascending,
+        collapse_franchises=collapse_franchises,
+    )
+    if wants_ndjson(accept):
+        return search(**params, stream=True, fields=check_fields(fields))
+
+    # identical searches that arrive together (eg a popular page loading) run once
+    return search_flight.do(request_key(**params), lambda: search(**params))
+
+
+def search(
+    title: str = None,
+    author: str = None,
+    year_start_min: int = None,
+    year_start_max: int = None,
+    score_min: int = None,
+    licensed: bool = None,
+    completed: bool = None,
+    genres: list[str] = None,
+    genres_exclude: list[str] = None,
+    categories: list[str] = None,
+    categories_exclude: list[str] = None,
+    sort_by: str = None,
+    ascending: bool = True,
+    collapse_franchises: bool = False,
+    stream: bool = False,
+    fields: list[str] = None,
 ):
     categories = categories or []
     categories_exclude = categories_exclude or []
 
+    franchise_index = None
+    if collapse_franchises:
+        franchise_index = franchises.get()
+        if franchise_index is None:
+            raise HTTPException(503)
+
+    cat = catalog.get()
+    if cat is not None:
+        ids = None
+        if title or author:
+            with orm.db_session:
+                result = orm.select(s for s in db.entities["Series"])
+                result = filter_title(result, title)
+                result = filter_author(result, author)
+                ids = list(orm.select(s.id for s in result))
+
+        result = cat.search(
+            ids=ids,
+            year_start_min=year_start_min,
+            year_start_max=year_start_max,
+            score_min=score_min,
+            licensed=licensed,
+            completed=completed,
+            genres=genres,
+            genres_exclude=genres_exclude,
+            categories=categories,
+            categories_exclude=categories_exclude,
+            sort_by=sort_by,
+            ascending=ascending,
+        )
+        if franchise_index is not None:
+            result = franchise_index.collapse(result)
+        if stream:
+            return ndjson_response(chunked(result), fields)
+        return result.tolist()
+
     sort_key_map = {
         "title": db.entities["Series"].name,
         "year": db.entities["Series"].year,
         "score": db.entities["Series"].bayesian_rating,
-        # "time": last_update,
+        "time": db.entities["Series"].last_updated,
+        "trending": db.entities["Series"].trending,
+        "popularity": db.entities["Series"].popularity,
+        "composite": db.entities["Series"].composite_score,
     }
 
     with orm.db_session:
         result = orm.select(s for s in db.entities["Series"])
 
         # Filter title
-        title = (title or "").split(" ")
-        temp = db.entities["Title"]
-        for word in title:
-            temp = orm.select(t for t in temp if word in t.name)
-        temp = orm.select(t.series for t in temp)
-        result = orm.select(s for s in result if s in temp)
+        result = filter_title(result, title or "")
 
         # Filter author
-        author = (author or "").split(" ")
-        temp = db.entities["SeriesAuthor"]
-        for word in author:
-            temp = orm.select(a for a in temp if word in a.name)
-        temp = orm.select(a.series for a in temp)
-        result = orm.select(s for s in result if s in temp)
+        result = filter_author(result, author or "")
 
         # Filter year
         if year_start_min:
@@ -186,21 +485,37 @@ def get_search(
         if completed is not None:
             result = orm.select(s for s in result if s.completed == completed)
 
-        # Filter genres
-        genres = genres or []
-        for c in genres:
-            result = orm.select(s for s in result if c in s.genres.name)
-        genres_exclude = genres_exclude or []
-        for c in genres_exclude:
-            result = orm.select(s for s in result if c not in s.genres.name)
-
-        # Filter categories
-        categories = categories or []
-        for c in categories:
-            result = orm.select(s for s in result if c in s.categories.name)
-        categories_exclude = categories_exclude or []
-        for c in categories_exclude:
-            result = orm.select(s for s in result if c not in s.categories.name)
+        # Filter genres + categories
+        tags = get_tag_index()
+        tag_filter = None
+        if tags is not None:
+            # small id sets go into the query, large ones are applied to the sorted result
+            tag_filter = tags.filter(
+                genres, genres_exclude, categories, categories_exclude
+            )
+            include = tag_filter.include
+            if include is not None and len(include) <= SQL_MAX_IDS:
+                include = include.tolist()
+                result = orm.select(s for s in result if s.id in include)
+                tag_filter.include = None
+            if 0 < len(tag_filter.exclude) <= SQL_MAX_IDS:
+                exclude = tag_filter.exclude.tolist()
+                result = orm.select(s for s in result if s.id not in exclude)
+                tag_filter.exclude = tag_filter.exclude[:0]
+        else:
+            genres = genres or []
+            for c in genres:
+                result = orm.select(s for s in result if c in s.genres.name)
+            genres_exclude = genres_exclude or []
+            for c in genres_exclude:
+                result = orm.select(s for s in result if c not in s.genres.name)
+
+            categories = categories or []
+            for c in categories:
+                result = orm.select(s for s in result if c in s.categories.name)
+            categories_exclude = categories_exclude or []
+            for c in categories_exclude:
+                result = orm.select(s for s in result if c not in s.categories.name)
 
         # Sort
         sort_key = sort_key_map.get(sort_by, sort_key_map["score"])
@@ -210,6 +525,71 @@ def get_search(
             result = result.order_by(orm.desc(sort_key))
 
         result = orm.select(s.id for s in result)
-        result = list(result)
+        if stream:
+            chunks = iter_query(result)
+            if tag_filter is not None:
+                # filtering keeps the order, so it can be done a chunk at a time
+                chunks = (tag_filter.apply(ids).tolist() for ids in chunks)
+            if franchise_index is not None:
+                chunks = franchise_index.collapse_chunks(chunks)
+        else:
+            result = list(result)
+
+    if stream:
+        return ndjson_response(chunks, fields)
+
+    if tag_filter is not None:
+        result = tag_filter.apply(result).tolist()
+    if franchise_index is not None:
+        result = franchise_index.collapse(result).tolist()
 
     return result
+
+
+@app.get("/series/ids/{id}/similar")
+def get_similar(
+    id: int,
+    limit: int = Query(default=20, ge=1, le=100),
+    year_start_min: int = None,
+    year_start_max: int = None,
+    score_min: int = None,
+    licensed: bool = None,
+    completed: bool = None,
+    genres: list[str] = Query(None),
+    genres_exclude: list[str] = Query(None),
+    categories: list[str] = Query(None),
+    categories_exclude: list[str] = Query(None),
+):
+    """
+    "More like this" by cosine similarity of the category vectors.
+    """
+
+    vectors = category_vectors.get()
+    if vectors is None:
+        raise HTTPException(503)
+    if vectors.row_of(id) is None:
+        raise HTTPException(404)
+
+    filters = dict(
+        year_start_min=year_start_min,
+        year_start_max=year_start_max,
+        score_min=score_min,
+        licensed=licensed,
+        completed=completed,
+        genres=genres,
+        genres_exclude=genres_exclude,
+        categories=categories,
+        categories_exclude=categories_exclude,
+    )
+
+    candidates = None
+    if any(x is not None for x in filters.values()):
+        candidates = search(**filters)
+
+    keys = ["id", "score"]
+    return [dict(zip(keys, r)) for r in vectors.similar(id, limit, candidates)]
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
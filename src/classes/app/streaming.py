@@ -0,0 +1,130 @@
+"""
+Newline delimited json responses, one series per line, for results too big to build as one list.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Iterable, Iterator
+
+from classes.models import db, sql_hooks
+from config import paths
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pony import orm
+
+NDJSON = "application/x-ndjson"
+
+# ids per chunk, also the size of the IN (...) used to look up projected fields
+CHUNK_SIZE = 500
+
+# fields that can be included in each line, see project()
+SERIES_FIELDS = [
+    "title",
+    "year",
+    "bayesian_rating",
+    "licensed",
+    "completed",
+    "type",
+    "popularity",
+    "last_updated",
+]
+
+
+def wants_ndjson(accept: str) -> bool:
+    return NDJSON in accept
+
+
+def check_fields(fields: list[str] | None) -> list[str]:
+    fields = fields or []
+    unknown = [f for f in fields if f not in SERIES_FIELDS]
+    if unknown:
+        raise HTTPException(400, f"Unknown fields {unknown}, expected {SERIES_FIELDS}")
+    return fields
+
+
+def chunked(ids: Iterable[int], size: int = CHUNK_SIZE) -> Iterator[list[int]]:
+    chunk = []
+    for id in ids:
+        chunk.append(int(id))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_query(
+    query: orm.core.Query,
+    limit: int | None = None,
+    offset: int | None = None,
+    size: int = CHUNK_SIZE,
+) -> Iterator[list]:
+    """
+    Run a single column pony query on its own connection and yield the results [size] at a time.
+    Pony always fetches the whole result, this reads it through an sqlite cursor instead.
+    Must be called in a db_session, but the returned iterator can be consumed outside of it (or from another thread).
+    """
+
+    sql, arguments, _, _ = query._construct_sql_and_arguments(limit, offset)
+
+    def rows():
+        # read-only, and it keeps reading the same file even if a new import is published meanwhile
+        conn = sqlite3.connect(
+            f"{paths.DB_FILE.as_uri()}?mode=ro", uri=True, check_same_thread=False
+        )
+        try:
+            start = time.perf_counter()
+            cursor = conn.execute(sql, arguments)
+            elapsed = time.perf_counter() - start
+            for hook in sql_hooks:
+                hook(sql, arguments, elapsed)
+
+            while chunk := cursor.fetchmany(size):
+                yield [r[0] for r in chunk]
+        finally:
+            conn.close()
+
+    return rows()
+
+
+def project(ids: list[int], fields: list[str]) -> list[dict]:
+    with orm.db_session:
+        rows = orm.select(
+            (
+                s.id,
+                s.name,
+                s.year,
+                s.bayesian_rating,
+                s.licensed,
+                s.completed,
+                s.type.name,
+                s.popularity,
+                s.last_updated,
+            )
+            for s in db.entities["Series"]
+            if s.id in ids
+        )[:]
+
+    by_id = {r[0]: dict(zip(["id", *SERIES_FIELDS], r)) for r in rows}
+    return [
+        dict(id=id) | {f: by_id[id][f] for f in fields} for id in ids if id in by_id
+    ]
+
+
+def ndjson_response(
+    chunks: Iterator[list[int]], fields: list[str] | None = None
+) -> StreamingResponse:
+    """
+    One line per id, either just the id or an object with the id and [fields].
+    Each chunk is sent as it's ready, so the first lines go out before the rest are looked up.
+    """
+
+    def lines():
+        for ids in chunks:
+            if not ids:
+                continue
+            items = project(ids, fields) if fields else ids
+            yield "".join(json.dumps(x) + "\n" for x in items)
+
+    return StreamingResponse(lines(), media_type=NDJSON)
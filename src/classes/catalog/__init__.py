@@ -0,0 +1,19 @@
+from .catalog import Catalog
+from .category_matrix import CategoryMatrix
+from .franchise import FranchiseIndex
+from .graph import RecommendationGraph, RelationGraph
+from .prefix_index import PrefixIndex
+from .reloadable import Reloadable
+from .similarity import CategoryVectors
+from .tag_index import TagFilter, TagIndex
+
+catalog: Reloadable[Catalog] = Reloadable(Catalog.load)
+
+# standalone tag index for the sql search path (the catalog carries its own)
+tag_index: Reloadable[TagIndex] = Reloadable(TagIndex.load)
+
+recommendations: Reloadable[RecommendationGraph] = Reloadable(RecommendationGraph.load)
+relations: Reloadable[RelationGraph] = Reloadable(RelationGraph.load)
+franchises: Reloadable[FranchiseIndex] = Reloadable(FranchiseIndex.load)
+category_vectors: Reloadable[CategoryVectors] = Reloadable(CategoryVectors.load)
+prefix_index: Reloadable[PrefixIndex] = Reloadable(PrefixIndex.load)
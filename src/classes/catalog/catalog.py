@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+from classes.models import db
+from config import paths
+from pony import orm
+
+from .snapshot import StringColumn, open_snapshot, save_snapshot
+from .tag_index import TagIndex
+
+YEAR_NULL = np.iinfo(np.int32).min
+
+
+class Catalog:
+    """
+    Read-only, column-oriented copy of the series scalars for the hot search / facet paths.
+    Row i of every column describes the series with id ids[i] (ids are sorted).
+    Built at import and saved as a snapshot that server workers mmap, see snapshot.py.
+    """
+
+    ids: np.ndarray  # int64
+    years: np.ndarray  # int32, YEAR_NULL if missing
+    ratings: np.ndarray  # float32, nan if missing
+    licensed: np.ndarray  # bool
+    completed: np.ndarray  # bool
+    type_codes: np.ndarray  # int16, index into type_names
+    name_ranks: np.ndarray  # int32, position of each row when sorted by name
+
+    # sort columns, nan if missing
+    last_updated: np.ndarray  # float64
+    trending: np.ndarray  # float32
+    popularity: np.ndarray  # float32
+    composite_scores: np.ndarray  # float32
+
+    names: StringColumn
+    type_names: list[str]
+
+    tags: TagIndex
+
+    file = paths.INDEX_DIR / "catalog.bin"
+
+    # numeric columns, in snapshot order
+    columns = [
+        "ids",
+        "years",
+        "ratings",
+        "licensed",
+        "completed",
+        "type_codes",
+        "name_ranks",
+        "last_updated",
+        "trending",
+        "popularity",
+        "composite_scores",
+    ]
+
+    def __init__(
+        self,
+        columns: dict[str, np.ndarray],
+        names: StringColumn,
+        type_names: list[str],
+        tags: TagIndex,
+    ):
+        for name in self.columns:
+            setattr(self, name, columns[name])
+
+        self.names = names
+        self.type_names = type_names
+        self.tags = tags
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple], tags: TagIndex) -> Catalog:
+        rows = sorted(rows, key=lambda r: r[0])
+        columns = dict()
+
+        columns["ids"] = np.array([r[0] for r in rows], dtype=np.int64)
+        names = [r[1] for r in rows]
+        columns["years"] = np.array(
+            [YEAR_NULL if r[2] is None else r[2] for r in rows], dtype=np.int32
+        )
+        columns["ratings"] = cls._column(rows, 3, np.float32)
+        columns["licensed"] = np.array([r[4] for r in rows], dtype=bool)
+        columns["completed"] = np.array([r[5] for r in rows], dtype=bool)
+
+        type_names = sorted(set(r[6] for r in rows))
+        type_map = {name: i for i, name in enumerate(type_names)}
+        columns["type_codes"] = np.array([type_map[r[6]] for r in rows], dtype=np.int16)
+
+        columns["last_updated"] = cls._column(rows, 7, np.float64)
+        columns["trending"] = cls._column(rows, 8, np.float32)
+        columns["popularity"] = cls._column(rows, 9, np.float32)
+        columns["composite_scores"] = cls._column(rows, 10, np.float32)
+
+        order = sorted(range(len(rows)), key=lambda i: names[i])
+        columns["name_ranks"] = np.empty(len(rows), dtype=np.int32)
+        columns["name_ranks"][order] = np.arange(len(rows), dtype=np.int32)
+
+        return cls(columns, StringColumn.from_strings(names), type_names, tags)
+
+    @property
+    def sort_columns(self) -> dict[str, np.ndarray]:
+        return {
+            "score": self.ratings,
+            "time": self.last_updated,
+            "trending": self.trending,
+            "popularity": self.popularity,
+            "composite": self.composite_scores,
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls) -> Catalog:
+        """
+        Read the catalog out of the db. Done at import time, the server maps the saved snapshot instead.
+        """
+
+        Series = db.entities["Series"]
+
+        with orm.db_session:
+            rows = orm.select(
+                [
+                    s.id,
+                    s.name,
+                    s.year,
+                    s.bayesian_rating,
+                    s.licensed,
+                    s.completed,
+                    s.type.name,
+                    s.last_updated,
+                    s.trending,
+                    s.popularity,
+                    s.composite_score,
+                ]
+                for s in Series
+            )[:]
+
+        return cls.from_rows(rows, TagIndex.load())
+
+    def save(self, file: Path = None) -> None:
+        arrays = {name: getattr(self, name) for name in self.columns}
+        save_snapshot(
+            file or self.file,
+            dict(type_names=self.type_names),
+            **arrays,
+            name_offsets=self.names.offsets,
+            name_data=self.names.data,
+            **self.tags.to_arrays(),
+        )
+
+    @classmethod
+    def load(cls) -> Catalog:
+        """
+        Map the snapshot written at import. Every worker process shares the same pages, and nothing is parsed up front.
+        Falls back to reading the db if there's no snapshot yet (ie the last import predates it).
+        """
+
+        if not cls.file.exists():
+            logging.warning(f"No catalog snapshot at [{cls.file}], reading the db")
+            return cls.build()
+
+        meta, arrays = open_snapshot(cls.file)
+        return cls(
+            arrays,
+            StringColumn(arrays["name_offsets"], arrays["name_data"]),
+            meta["type_names"],
+            TagIndex.from_arrays(arrays),
+        )
+
+    @staticmethod
+    def _column(rows: list[tuple], idx: int, dtype) -> np.ndarray:
+        values = [np.nan if r[idx] is None else r[idx] for r in rows]
+        return np.array(values, dtype=dtype)
+
+    def rows_of(self, ids: Iterable[int]) -> np.ndarray:
+        """
+        Map series ids to row indices, dropping ids that aren't in the catalog.
+        """
+
+        ids = np.fromiter(ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+
+        in_range = rows < len(self.ids)
+        rows, ids = rows[in_range], ids[in_range]
+        return rows[self.ids[rows] == ids]
+
+    def row(self, id: int) -> int | None:
+        row = int(np.searchsorted(self.ids, id))
+        if row < len(self.ids) and self.ids[row] == id:
+            return row
+        return None
+
+    def search(
+        self,
+        ids: Iterable[int] = None,
+        year_start_min: int = None,
+        year_start_max: int = None,
+        score_min: float = None,
+        licensed: bool = None,
+        completed: bool = None,
+        genres: list[str] = None,
+        genres_exclude: list[str] = None,
+        categories: list[str] = None,
+        categories_exclude: list[str] = None,
+        sort_by: str = None,
+        ascending: bool = True,
+    ) -> np.ndarray:
+        """
+        Vectorized equivalent of the sql search. Returns the matching series ids in sorted order.
+        """
+
+        if ids is not None:
+            mask = np.zeros(len(self.ids), dtype=bool)
+            mask[self.rows_of(ids)] = True
+        else:
+            mask = np.ones(len(self.ids), dtype=bool)
+
+        # Filter year
+        if year_start_min:
+            mask &= self.years >= year_start_min
+        if year_start_max:
+            mask &= (self.years <= year_start_max) & (self.years != YEAR_NULL)
+
+        # Filter score
+        if score_min:
+            mask &= self.ratings >= score_min
+
+        # Filter status
+        if licensed is not None:
+            mask &= self.licensed == licensed
+        if completed is not None:
+            mask &= self.completed == completed
+
+        # Filter genres + categories
+        tag_filter = self.tags.filter(
+            genres, genres_exclude, categories, categories_exclude
+        )
+        if tag_filter.include is not None:
+            include = np.zeros(len(self.ids), dtype=bool)
+            include[self.rows_of(tag_filter.include)] = True
+            mask &= include
+        mask[self.rows_of(tag_filter.exclude)] = False
+
+        # Sort (nulls first when ascending, like sqlite)
+        rows = np.flatnonzero(mask)
+        if sort_by == "title":
+            key = self.name_ranks[rows]
+        elif sort_by == "year":
+            key = self.years[rows]
+        else:
+            key = self.sort_columns.get(sort_by, self.ratings)[rows]
+            key = np.nan_to_num(key, nan=-np.inf)
+
+        rows = rows[np.argsort(key, kind="stable")]
+        if not ascending:
+            rows = rows[::-1]
+
+        return self.ids[rows]
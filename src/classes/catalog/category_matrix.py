@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import numpy as np
+from classes.models import db
+from pony import orm
+
+
+class CategoryMatrix:
+    """
+    Sparse (series x category type) matrix of category votes in CSR form.
+    Row i holds the categories of series ids[i], sorted by column.
+    """
+
+    ids: np.ndarray  # int64, sorted
+    indptr: np.ndarray  # int64, len(ids) + 1
+    columns: np.ndarray  # int32, index into column_names
+    values: np.ndarray  # float32
+
+    column_names: list[str]
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        indptr: np.ndarray,
+        columns: np.ndarray,
+        values: np.ndarray,
+        column_names: list[str],
+    ):
+        self.ids = ids
+        self.indptr = indptr
+        self.columns = columns
+        self.values = values
+        self.column_names = column_names
+
+    @classmethod
+    def load(cls, batch_size: int = 100_000) -> CategoryMatrix:
+        # read in batches so the full table never sits in memory as python tuples
+        series = [np.empty(0, dtype=np.int64)]
+        columns = [np.empty(0, dtype=np.int32)]
+        values = [np.empty(0, dtype=np.float32)]
+        column_map: dict[str, int] = dict()
+
+        with orm.db_session:
+            cursor = db.execute('SELECT "series", "type", "votes" FROM "Category"')
+            while rows := cursor.fetchmany(batch_size):
+                ids, names, votes = zip(*rows)
+                codes = [column_map.setdefault(x, len(column_map)) for x in names]
+
+                series.append(np.array(ids, dtype=np.int64))
+                columns.append(np.array(codes, dtype=np.int32))
+                values.append(np.array(votes, dtype=np.float32))
+
+        series = np.concatenate(series)
+        columns = np.concatenate(columns)
+        values = np.clip(np.concatenate(values), 0, None)
+
+        order = np.lexsort((columns, series))
+        series, columns, values = series[order], columns[order], values[order]
+
+        ids = np.unique(series)
+        indptr = np.searchsorted(series, np.append(ids, np.iinfo(np.int64).max))
+
+        column_names = sorted(column_map, key=column_map.get)
+        return cls(ids, indptr, columns, values, column_names)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_of(self, id: int) -> int | None:
+        row = int(np.searchsorted(self.ids, id))
+        if row < len(self.ids) and self.ids[row] == id:
+            return row
+        return None
+
+    def row(self, row: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.columns[start:end], self.values[start:end]
+
+    def shared_votes(self, row_1: int, row_2: int) -> float:
+        """
+        Fraction of row_1's vote mass on categories that row_2 also has.
+        """
+
+        cols_1, votes_1 = self.row(row_1)
+        cols_2, votes_2 = self.row(row_2)
+
+        total = votes_1.sum()
+        if total <= 0:
+            return 0
+
+        _, idx_1, idx_2 = np.intersect1d(
+            cols_1, cols_2, assume_unique=True, return_indices=True
+        )
+        shared = np.minimum(votes_1[idx_1], votes_2[idx_2]).sum()
+        return float(shared / total)
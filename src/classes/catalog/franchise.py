@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+from classes.models import db
+from config import paths
+from pony import orm
+
+from .graph import _group_edges
+from .snapshot import open_snapshot, save_snapshot
+
+# how central a relation makes its target, lower comes first in the franchise order
+# (the main line, then adaptations, then side stories and spin-offs)
+RELATION_ORDER = {
+    "Main Story": 0,
+    "Prequel": 0,
+    "Sequel": 0,
+    "Adapted From": 1,
+    "Alternate Story": 2,
+    "Side Story": 2,
+    "Spin-Off": 3,
+}
+UNKNOWN_ORDER = 4
+
+YEAR_NULL = np.iinfo(np.int32).max
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent: dict[int, int] = dict()
+        self.size: dict[int, int] = dict()
+
+    def find(self, x: int) -> int:
+        root = self.parent.setdefault(x, x)
+        while root != self.parent[root]:
+            root = self.parent[root]
+
+        # path compression
+        while x != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size.get(a, 1) < self.size.get(b, 1):
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] = self.size.get(a, 1) + self.size.get(b, 1)
+
+
+class FranchiseIndex:
+    """
+    Series grouped into franchises, the connected components of the relation graph, precomputed at import.
+    A franchise is identified by its lowest series id, series without relations are a franchise of their own
+    and aren't stored. Saved as a snapshot like the graphs.
+    """
+
+    file = paths.INDEX_DIR / "franchises.bin"
+
+    ids: np.ndarray  # int64, sorted, every series with at least one relation
+    franchise_ids: np.ndarray  # int64, franchise of ids[i]
+
+    franchises: np.ndarray  # int64, sorted
+    indptr: np.ndarray  # int64, len(franchises) + 1
+    members: np.ndarray  # int64, in franchise order, see RELATION_ORDER
+    roles: (
+        np.ndarray
+    )  # int16, index into type_names of how each member is related, -1 for the root(s)
+
+    type_names: list[str]
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        franchise_ids: np.ndarray,
+        franchises: np.ndarray,
+        indptr: np.ndarray,
+        members: np.ndarray,
+        roles: np.ndarray,
+        type_names: list[str],
+    ):
+        self.ids = ids
+        self.franchise_ids = franchise_ids
+        self.franchises = franchises
+        self.indptr = indptr
+        self.members = members
+        self.roles = roles
+        self.type_names = type_names
+
+    @classmethod
+    def build(cls) -> FranchiseIndex:
+        with orm.db_session:
+            rows = orm.select(
+                [r.series_1.id, r.series_2.id, r.relation_type.name]
+                for r in db.entities["Relation"]
+            )[:]
+            years = dict(orm.select([s.id, s.year] for s in db.entities["Series"])[:])
+
+        # relations can point at series that weren't imported
+        rows = [r for r in rows if r[0] in years and r[1] in years]
+        if len(rows) == 0:
+            return cls.empty()
+
+        uf = UnionFind()
+        for src, dst, _ in rows:
+            uf.union(src, dst)
+
+        # each series takes the most central relation pointing at it
+        type_names = sorted(set(r[2] for r in rows))
+        type_map = {name: i for i, name in enumerate(type_names)}
+        roles: dict[int, int] = dict()
+        for _, dst, typ in rows:
+            rank = RELATION_ORDER.get(typ, UNKNOWN_ORDER)
+            current = roles.get(dst)
+            if current is None or rank < RELATION_ORDER.get(
+                type_names[current], UNKNOWN_ORDER
+            ):
+                roles[dst] = type_map[typ]
+
+        ids = np.array(sorted(uf.parent), dtype=np.int64)
+        roots = np.array([uf.find(id) for id in ids.tolist()], dtype=np.int64)
+        # franchise id = lowest member id, stable across imports unlike the union-find root
+        lowest = dict()
+        for id, root in zip(ids.tolist(), roots.tolist()):
+            lowest.setdefault(root, id)
+        franchise_ids = np.array([lowest[r] for r in roots.tolist()], dtype=np.int64)
+
+        member_roles = np.array([roles.get(id, -1) for id in ids.tolist()], np.int16)
+        ranks = np.array(
+            [
+                RELATION_ORDER.get(type_names[r], UNKNOWN_ORDER) if r >= 0 else 0
+                for r in member_roles.tolist()
+            ],
+            dtype=np.int16,
+        )
+        member_years = np.array(
+            [YEAR_NULL if years[id] is None else years[id] for id in ids.tolist()],
+            dtype=np.int32,
+        )
+
+        # group by franchise, then order by relation, year, id
+        order = np.lexsort((ids, member_years, ranks, franchise_ids))
+        franchises, indptr = _group_edges(franchise_ids, order)
+        return cls(
+            ids,
+            franchise_ids,
+            franchises,
+            indptr,
+            ids[order],
+            member_roles[order],
+            type_names,
+        )
+
+    @classmethod
+    def empty(cls) -> FranchiseIndex:
+        return cls(
+            ids=np.empty(0, dtype=np.int64),
+            franchise_ids=np.empty(0, dtype=np.int64),
+            franchises=np.empty(0, dtype=np.int64),
+            indptr=np.zeros(1, dtype=np.int64),
+            members=np.empty(0, dtype=np.int64),
+            roles=np.empty(0, dtype=np.int16),
+            type_names=[],
+        )
+
+    @classmethod
+    def load(cls, file: Path = None) -> FranchiseIndex:
+        file = file or cls.file
+        if not file.exists():
+            logging.warning(f"No franchise index at [{file}]")
+            return cls.empty()
+
+        meta, arrays = open_snapshot(file)
+        return cls(
+            arrays["ids"],
+            arrays["franchise_ids"],
+            arrays["franchises"],
+            arrays["indptr"],
+            arrays["members"],
+            arrays["roles"],
+            meta["type_names"],
+        )
+
+    def save(self, file: Path = None) -> None:
+        save_snapshot(
+            file or self.file,
+            dict(type_names=self.type_names),
+            ids=self.ids,
+            franchise_ids=self.franchise_ids,
+            franchises=self.franchises,
+            indptr=self.indptr,
+            members=self.members,
+            roles=self.roles,
+        )
+
+    def store(self) -> None:
+        """
+        Write Series.franchise_id, so sql queries can group by franchise too.
+        """
+
+        with orm.db_session:
+            db.execute('UPDATE "Series" SET "franchise_id" = "id"')
+            db.get_connection().executemany(
+                'UPDATE "Series" SET "franchise_id" = ? WHERE "id" = ?',
+                zip(self.franchise_ids.tolist(), self.ids.tolist()),
+            )
+
+    def franchise_of(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Franchise id of each of [ids], the id itself for series without relations.
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return ids.copy()
+
+        rows = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        found = self.ids[rows] == ids
+        return np.where(found, self.franchise_ids[rows], ids)
+
+    def franchise(self, id: int) -> tuple[int, list[tuple[int, str | None]]]:
+        """
+        (franchise id, [(member id, relation)]) of the franchise [id] belongs to, in franchise order.
+        """
+
+        franchise_id = int(self.franchise_of(np.array([id]))[0])
+        row = int(np.searchsorted(self.franchises, franchise_id))
+        if row >= len(self.franchises) or self.franchises[row] != franchise_id:
+            return franchise_id, [(id, None)]
+
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return franchise_id, [
+            (member, self.type_names[role] if role >= 0 else None)
+            for member, role in zip(
+                self.members[start:end].tolist(), self.roles[start:end].tolist()
+            )
+        ]
+
+    def collapse(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Keep only the first of [ids] from each franchise, in the original order.
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        _, first = np.unique(self.franchise_of(ids), return_index=True)
+        return ids[np.sort(first)]
+
+    def collapse_chunks(self, chunks: Iterable[list[int]]) -> Iterator[list[int]]:
+        """
+        collapse() over a stream of ids, remembering which franchises were already seen.
+        """
+
+        seen = set()
+        for ids in chunks:
+            keep = []
+            for id, franchise_id in zip(ids, self.franchise_of(ids).tolist()):
+                if franchise_id not in seen:
+                    seen.add(franchise_id)
+                    keep.append(id)
+            yield keep
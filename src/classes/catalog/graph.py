@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import numpy as np
+from classes.models import db
+from config import paths
+from pony import orm
+
+from .category_matrix import CategoryMatrix
+from .snapshot import open_snapshot, save_snapshot
+
+# default blend of (user recs, category recs, shared categories)
+DEFAULT_WEIGHTS = (1.0, 0.5, 0.5)
+
+
+def _group_edges(
+    sources: np.ndarray, order: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Given edge sources and an ordering that groups them, return (ids, indptr) in CSR form.
+    """
+
+    sources = sources[order]
+    ids = np.unique(sources)
+    indptr = np.searchsorted(sources, np.append(ids, np.iinfo(np.int64).max))
+    return ids, indptr
+
+
+class RecommendationGraph:
+    """
+    Adjacency list of recommended series, precomputed at import.
+    Each series' neighbours are stored contiguously and sorted by their default blended score.
+    Saved as a snapshot that server workers mmap, see snapshot.py.
+    """
+
+    file = paths.INDEX_DIR / "recommendations.bin"
+
+    ids: np.ndarray  # int64, sorted
+    indptr: np.ndarray  # int64, len(ids) + 1
+    targets: np.ndarray  # int64
+    # float32, (num_edges, 3) scores for (user, category, shared)
+    components: np.ndarray
+    scores: np.ndarray  # float32, default blended score
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        indptr: np.ndarray,
+        targets: np.ndarray,
+        components: np.ndarray,
+        scores: np.ndarray = None,
+    ):
+        self.ids = ids
+        self.indptr = indptr
+        self.targets = targets
+        self.components = components
+
+        if scores is None:
+            scores = components @ np.array(DEFAULT_WEIGHTS, dtype=np.float32)
+        self.scores = scores
+
+    @classmethod
+    def build(cls, matrix: CategoryMatrix = None) -> RecommendationGraph:
+        edges: dict[tuple[int, int], list[float]] = dict()
+
+        with orm.db_session:
+            user_recs = orm.select(
+                [r.series_1.id, r.series_2.id, r.weight]
+                for r in db.entities["Recommendation"]
+            )[:]
+            cat_recs = orm.select(
+                [r.base_series.id, r.recommendation.id, r.weight]
+                for r in db.entities["CategoryRecommendation"]
+            )[:]
+
+        # weights are normalized by the strongest recommendation of each series
+        for col, recs in enumerate([user_recs, cat_recs]):
+            max_weights: dict[int, int] = dict()
+            for src, _, weight in recs:
+                max_weights[src] = max(max_weights.get(src, 0), weight)
+
+            for src, dst, weight in recs:
+                edge = edges.setdefault((src, dst), [0, 0, 0])
+                edge[col] = weight / max_weights[src] if max_weights[src] > 0 else 0
+
+        matrix = matrix or CategoryMatrix.load()
+        for (src, dst), edge in edges.items():
+            row_1, row_2 = matrix.row_of(src), matrix.row_of(dst)
+            if row_1 is not None and row_2 is not None:
+                edge[2] = matrix.shared_votes(row_1, row_2)
+
+        if len(edges) == 0:
+            return cls.empty()
+
+        pairs = np.array(list(edges.keys()), dtype=np.int64)
+        components = np.array(list(edges.values()), dtype=np.float32)
+        scores = components @ np.array(DEFAULT_WEIGHTS, dtype=np.float32)
+
+        order = np.lexsort((-scores, pairs[:, 0]))
+        ids, indptr = _group_edges(pairs[:, 0], order)
+        return cls(ids, indptr, pairs[order, 1], components[order], scores[order])
+
+    @classmethod
+    def empty(cls) -> RecommendationGraph:
+        return cls(
+            ids=np.empty(0, dtype=np.int64),
+            indptr=np.zeros(1, dtype=np.int64),
+            targets=np.empty(0, dtype=np.int64),
+            components=np.empty((0, 3), dtype=np.float32),
+        )
+
+    @classmethod
+    def load(cls, file: Path = None) -> RecommendationGraph:
+        file = file or cls.file
+        if not file.exists():
+            logging.warning(f"No recommendation graph at [{file}]")
+            return cls.empty()
+
+        _, arrays = open_snapshot(file)
+        return cls(
+            arrays["ids"],
+            arrays["indptr"],
+            arrays["targets"],
+            arrays["components"],
+            arrays["scores"],
+        )
+
+    def save(self, file: Path = None) -> None:
+        save_snapshot(
+            file or self.file,
+            dict(),
+            ids=self.ids,
+            indptr=self.indptr,
+            targets=self.targets,
+            components=self.components,
+            scores=self.scores,
+        )
+
+    def top(
+        self, id: int, limit: int, weights: tuple[float, float, float] = None
+    ) -> list[tuple[int, float]]:
+        row = int(np.searchsorted(self.ids, id))
+        if row >= len(self.ids) or self.ids[row] != id:
+            return []
+
+        start, end = self.indptr[row], self.indptr[row + 1]
+        if weights is None:
+            # already sorted, so this is just a slice
+            end = min(end, start + limit)
+            targets, scores = self.targets[start:end], self.scores[start:end]
+        else:
+            scores = self.components[start:end] @ np.array(weights, dtype=np.float32)
+            order = np.argsort(-scores, kind="stable")[:limit]
+            targets, scores = self.targets[start:end][order], scores[order]
+
+        return list(zip(targets.tolist(), scores.tolist()))
+
+
+class RelationGraph:
+    """
+    Adjacency list of related series (sequels, spin-offs, ...), precomputed at import.
+    Saved as a snapshot like RecommendationGraph.
+    """
+
+    file = paths.INDEX_DIR / "relations.bin"
+
+    ids: np.ndarray  # int64, sorted
+    indptr: np.ndarray  # int64, len(ids) + 1
+    targets: np.ndarray  # int64
+    types: np.ndarray  # int16, index into type_names
+
+    type_names: list[str]
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        indptr: np.ndarray,
+        targets: np.ndarray,
+        types: np.ndarray,
+        type_names: list[str],
+    ):
+        self.ids = ids
+        self.indptr = indptr
+        self.targets = targets
+        self.types = types
+        self.type_names = type_names
+
+    @classmethod
+    def build(cls) -> RelationGraph:
+        with orm.db_session:
+            rows = orm.select(
+                [r.series_1.id, r.series_2.id, r.relation_type.name]
+                for r in db.entities["Relation"]
+            )[:]
+
+        if len(rows) == 0:
+            return cls.empty()
+
+        type_names = sorted(set(r[2] for r in rows))
+        type_map = {name: i for i, name in enumerate(type_names)}
+
+        sources = np.array([r[0] for r in rows], dtype=np.int64)
+        targets = np.array([r[1] for r in rows], dtype=np.int64)
+        types = np.array([type_map[r[2]] for r in rows], dtype=np.int16)
+
+        order = np.lexsort((targets, types, sources))
+        ids, indptr = _group_edges(sources, order)
+        return cls(ids, indptr, targets[order], types[order], type_names)
+
+    @classmethod
+    def empty(cls) -> RelationGraph:
+        return cls(
+            ids=np.empty(0, dtype=np.int64),
+            indptr=np.zeros(1, dtype=np.int64),
+            targets=np.empty(0, dtype=np.int64),
+            types=np.empty(0, dtype=np.int16),
+            type_names=[],
+        )
+
+    @classmethod
+    def load(cls, file: Path = None) -> RelationGraph:
+        file = file or cls.file
+        if not file.exists():
+            logging.warning(f"No relation graph at [{file}]")
+            return cls.empty()
+
+        meta, arrays = open_snapshot(file)
+        return cls(
+            arrays["ids"],
+            arrays["indptr"],
+            arrays["targets"],
+            arrays["types"],
+            meta["type_names"],
+        )
+
+    def save(self, file: Path = None) -> None:
+        save_snapshot(
+            file or self.file,
+            dict(type_names=self.type_names),
+            ids=self.ids,
+            indptr=self.indptr,
+            targets=self.targets,
+            types=self.types,
+        )
+
+    def related(self, id: int) -> list[tuple[int, str]]:
+        row = int(np.searchsorted(self.ids, id))
+        if row >= len(self.ids) or self.ids[row] != id:
+            return []
+
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return [
+            (target, self.type_names[typ])
+            for target, typ in zip(
+                self.targets[start:end].tolist(), self.types[start:end].tolist()
+            )
+        ]
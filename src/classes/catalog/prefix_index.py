@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import logging
+from bisect import bisect_left
+from pathlib import Path
+
+import numpy as np
+from classes.models import db
+from config import paths
+from pony import orm
+from utils.text import normalize_title
+
+from .snapshot import StringColumn, open_snapshot, save_snapshot
+
+# past the last code point, so (prefix + MAX_CHAR) sorts after every string starting with prefix
+MAX_CHAR = chr(0x10FFFF)
+
+
+class PrefixIndex:
+    """
+    Sorted array of normalized titles / author names for typeahead lookups.
+    Matches are ranked by the series' composite score (rating x popularity).
+    Built at import and saved as a snapshot that server workers mmap, see snapshot.py.
+    """
+
+    file = paths.INDEX_DIR / "prefixes.bin"
+
+    # prefixes this short match too many keys to rank per keystroke, so their results are precomputed
+    precomputed_length = 2
+    precomputed_limit = 50
+
+    keys: StringColumn  # sorted
+    series: np.ndarray  # int64, series id of each key
+    scores: np.ndarray  # float32, rank score of each key
+
+    name_ids: np.ndarray  # int64, sorted
+    names: StringColumn  # display name of name_ids[i]
+
+    # precomputed results in CSR form, top_ids[top_indptr[i]:top_indptr[i+1]] are the matches of top_keys[i]
+    top_keys: StringColumn  # sorted
+    top_indptr: np.ndarray  # int64, len(top_keys) + 1
+    top_ids: np.ndarray  # int64
+
+    def __init__(
+        self,
+        keys: StringColumn,
+        series: np.ndarray,
+        scores: np.ndarray,
+        name_ids: np.ndarray,
+        names: StringColumn,
+        top_keys: StringColumn,
+        top_indptr: np.ndarray,
+        top_ids: np.ndarray,
+    ):
+        self.keys = keys
+        self.series = series
+        self.scores = scores
+        self.name_ids = name_ids
+        self.names = names
+        self.top_keys = top_keys
+        self.top_indptr = top_indptr
+        self.top_ids = top_ids
+
+    @classmethod
+    def from_rows(
+        cls, entries: list[tuple[str, int]], series_rows: list[tuple]
+    ) -> PrefixIndex:
+        """
+        [entries] are (normalized name, series id) pairs.
+        """
+
+        entries = sorted(set((k, id) for k, id in entries if k))
+        series_rows = sorted(series_rows, key=lambda r: r[0])
+        score_map = {id: score or 0 for id, _, score in series_rows}
+
+        keys = [k for k, _ in entries]
+        index = cls(
+            StringColumn.from_strings(keys),
+            np.array([id for _, id in entries], dtype=np.int64),
+            np.array([score_map.get(id, 0) for _, id in entries], dtype=np.float32),
+            np.array([id for id, _, _ in series_rows], dtype=np.int64),
+            StringColumn.from_strings([name for _, name, _ in series_rows]),
+            StringColumn.from_strings([]),
+            np.zeros(1, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+        )
+
+        lengths = range(1, cls.precomputed_length + 1)
+        prefixes = sorted(set(k[:n] for k in keys for n in lengths))
+        tops = [index._rank(prefix, cls.precomputed_limit) for prefix in prefixes]
+
+        index.top_keys = StringColumn.from_strings(prefixes)
+        index.top_indptr = np.zeros(len(tops) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in tops], out=index.top_indptr[1:])
+        index.top_ids = np.array([id for x in tops for id in x], dtype=np.int64)
+        return index
+
+    @classmethod
+    def build(cls) -> PrefixIndex:
+        """
+        Read the index out of the db. Done at import time, the server maps the saved snapshot instead.
+        """
+
+        with orm.db_session:
+            titles = orm.select(
+                [t.normalized, t.series.id] for t in db.entities["Title"]
+            )[:]
+            authors = orm.select(
+                [a.name, a.series.id] for a in db.entities["SeriesAuthor"]
+            )[:]
+            authors = [(normalize_title(name), id) for name, id in authors]
+            series_rows = orm.select(
+                [s.id, s.name, s.composite_score] for s in db.entities["Series"]
+            )[:]
+
+        return cls.from_rows(list(titles) + list(authors), series_rows)
+
+    def save(self, file: Path = None) -> None:
+        save_snapshot(
+            file or self.file,
+            dict(),
+            key_offsets=self.keys.offsets,
+            key_data=self.keys.data,
+            series=self.series,
+            scores=self.scores,
+            name_ids=self.name_ids,
+            name_offsets=self.names.offsets,
+            name_data=self.names.data,
+            top_key_offsets=self.top_keys.offsets,
+            top_key_data=self.top_keys.data,
+            top_indptr=self.top_indptr,
+            top_ids=self.top_ids,
+        )
+
+    @classmethod
+    def load(cls) -> PrefixIndex:
+        """
+        Map the snapshot written at import, falling back to reading the db if there isn't one yet.
+        """
+
+        if not cls.file.exists():
+            logging.warning(f"No prefix index snapshot at [{cls.file}], reading the db")
+            return cls.build()
+
+        _, arrays = open_snapshot(cls.file)
+        return cls(
+            StringColumn(arrays["key_offsets"], arrays["key_data"]),
+            arrays["series"],
+            arrays["scores"],
+            arrays["name_ids"],
+            StringColumn(arrays["name_offsets"], arrays["name_data"]),
+            StringColumn(arrays["top_key_offsets"], arrays["top_key_data"]),
+            arrays["top_indptr"],
+            arrays["top_ids"],
+        )
+
+    def _rank(self, prefix: str, limit: int) -> list[int]:
+        # bisecting the mapped keys only decodes the ~log2(n) strings it compares against
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + MAX_CHAR, lo=start)
+        if start == end:
+            return []
+
+        # over-fetch since one series can match through several titles
+        scores = self.scores[start:end]
+        num = min(len(scores), 4 * limit)
+        top = np.argpartition(-scores, num - 1)[:num]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        result = []
+        seen = set()
+        for id in self.series[start:end][top].tolist():
+            if id not in seen:
+                seen.add(id)
+                result.append(id)
+            if len(result) >= limit:
+                break
+
+        return result
+
+    def _precomputed(self, prefix: str) -> list[int]:
+        row = bisect_left(self.top_keys, prefix)
+        if row >= len(self.top_keys) or self.top_keys[row] != prefix:
+            return []
+        return self.top_ids[self.top_indptr[row] : self.top_indptr[row + 1]].tolist()
+
+    def name_of(self, id: int) -> str:
+        row = int(np.searchsorted(self.name_ids, id))
+        if row < len(self.name_ids) and self.name_ids[row] == id:
+            return self.names[row]
+        return ""
+
+    def suggest(self, query: str, limit: int = 10) -> list[tuple[int, str]]:
+        query = normalize_title(query)
+        if not query or limit < 1:
+            return []
+
+        if len(query) <= self.precomputed_length and limit <= self.precomputed_limit:
+            ids = self._precomputed(query)[:limit]
+        else:
+            ids = self._rank(query, limit)
+
+        return [(id, self.name_of(id)) for id in ids]
@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+from typing import Callable, Generic, TypeVar
+
+from utils import read_data_version
+
+T = TypeVar("T")
+
+
+class Reloadable(Generic[T]):
+    """
+    Holds a value built from the db and rebuilds it in the background whenever the importer bumps the data version.
+    Readers keep whatever value they grabbed, so a reload never shows them a half-built copy.
+    """
+
+    check_interval = 1.0
+
+    def __init__(self, load_fn: Callable[[], T]):
+        self.load_fn = load_fn
+        self.enabled = False
+        self.value: T | None = None
+        self.version: float | None = None
+
+        # a version that failed to load isn't retried until the importer bumps it again
+        self.failed_version: float | None = None
+
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+        with self._lock:
+            self._reload()
+
+    def reload(self) -> None:
+        with self._lock:
+            self._reload()
+
+    def _reload(self) -> None:
+        version = read_data_version()
+        start = time.time()
+        try:
+            value = self.load_fn()
+        except Exception:
+            logging.exception(
+                f"failed to load [{self.load_fn.__qualname__}] for data version [{version}]"
+            )
+            self.failed_version = version
+            return
+
+        logging.info(
+            f"loaded [{self.load_fn.__qualname__}] for data version [{version}] in {time.time()-start:.1f}s"
+        )
+
+        self.value = value
+        self.version = version
+        self.failed_version = None
+
+    def _reload_in_background(self) -> None:
+        # the lock is already held by whoever started this thread
+        try:
+            self._reload()
+        finally:
+            self._lock.release()
+
+    def get(self) -> T | None:
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        if now - self._checked > self.check_interval:
+            self._checked = now
+            version = read_data_version()
+            if (
+                version != self.version
+                and version != self.failed_version
+                and self._lock.acquire(blocking=False)
+            ):
+                threading.Thread(target=self._reload_in_background, daemon=True).start()
+
+        return self.value
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import numpy as np
+from config import paths
+
+from .category_matrix import CategoryMatrix
+from .snapshot import open_snapshot, save_snapshot
+
+
+def _gather(indptr: np.ndarray, slots: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenated element indices of the CSR / CSC slots, plus how long each slot was.
+    """
+
+    starts, ends = indptr[slots], indptr[slots + 1]
+    lengths = ends - starts
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(lengths.sum()) + offsets, lengths
+
+
+class CategoryVectors:
+    """
+    L2-normalized tf-idf vectors over each series' category votes, kept both row-wise (to look up a series' vector)
+    and column-wise (to score every series against it with a single sparse matrix-vector product).
+    Both layouts are saved in one snapshot that server workers mmap, see snapshot.py.
+    """
+
+    file = paths.INDEX_DIR / "category_vectors.bin"
+
+    # terms beyond this many (by weight) barely move the cosine, so queries skip them
+    max_query_terms = 64
+
+    ids: np.ndarray  # int64, sorted
+    indptr: np.ndarray  # int64, len(ids) + 1
+    columns: np.ndarray  # int32
+    # float16 is plenty for cosine ranking and halves the snapshot
+    values: np.ndarray  # float16
+
+    col_indptr: np.ndarray  # int64, num_columns + 1
+    col_rows: np.ndarray  # int32
+    col_values: np.ndarray  # float16
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        indptr: np.ndarray,
+        columns: np.ndarray,
+        values: np.ndarray,
+        col_indptr: np.ndarray,
+        col_rows: np.ndarray,
+        col_values: np.ndarray,
+    ):
+        self.ids = ids
+        self.indptr = indptr
+        self.columns = columns
+        self.values = values
+
+        self.col_indptr = col_indptr
+        self.col_rows = col_rows
+        self.col_values = col_values
+
+    @classmethod
+    def from_rows(
+        cls,
+        ids: np.ndarray,
+        indptr: np.ndarray,
+        columns: np.ndarray,
+        values: np.ndarray,
+        num_columns: int,
+    ) -> CategoryVectors:
+        """
+        Build the column-wise copy of row-wise (CSR) vectors.
+        """
+
+        values = values.astype(np.float16)
+        rows = np.repeat(np.arange(len(ids), dtype=np.int32), np.diff(indptr))
+        order = np.argsort(columns, kind="stable")
+        col_indptr = np.searchsorted(
+            columns[order], np.arange(num_columns + 1, dtype=np.int32)
+        ).astype(np.int64)
+
+        return cls(ids, indptr, columns, values, col_indptr, rows[order], values[order])
+
+    @classmethod
+    def build(cls, matrix: CategoryMatrix = None) -> CategoryVectors:
+        matrix = matrix or CategoryMatrix.load()
+        num_columns = len(matrix.column_names)
+
+        # dampen vote counts, then down-weight categories that nearly every series has
+        tf = np.log1p(matrix.values)
+        df = np.bincount(matrix.columns, minlength=num_columns)
+        idf = np.log((1 + len(matrix)) / (1 + df)) + 1
+        values = tf * idf[matrix.columns]
+
+        rows = np.repeat(np.arange(len(matrix)), np.diff(matrix.indptr))
+        norms = np.sqrt(np.bincount(rows, weights=values**2, minlength=len(matrix)))
+        values = values / np.maximum(norms[rows], 1e-12)
+
+        return cls.from_rows(
+            matrix.ids, matrix.indptr, matrix.columns, values, num_columns
+        )
+
+    @classmethod
+    def empty(cls) -> CategoryVectors:
+        return cls.from_rows(
+            ids=np.empty(0, dtype=np.int64),
+            indptr=np.zeros(1, dtype=np.int64),
+            columns=np.empty(0, dtype=np.int32),
+            values=np.empty(0, dtype=np.float32),
+            num_columns=0,
+        )
+
+    @classmethod
+    def load(cls, file: Path = None) -> CategoryVectors:
+        file = file or cls.file
+        if not file.exists():
+            logging.warning(f"No category vectors at [{file}]")
+            return cls.empty()
+
+        _, arrays = open_snapshot(file)
+        return cls(
+            arrays["ids"],
+            arrays["indptr"],
+            arrays["columns"],
+            arrays["values"],
+            arrays["col_indptr"],
+            arrays["col_rows"],
+            arrays["col_values"],
+        )
+
+    def save(self, file: Path = None) -> None:
+        save_snapshot(
+            file or self.file,
+            dict(),
+            ids=self.ids,
+            indptr=self.indptr,
+            columns=self.columns,
+            values=self.values,
+            col_indptr=self.col_indptr,
+            col_rows=self.col_rows,
+            col_values=self.col_values,
+        )
+
+    def row_of(self, id: int) -> int | None:
+        row = int(np.searchsorted(self.ids, id))
+        if row < len(self.ids) and self.ids[row] == id:
+            return row
+        return None
+
+    def similar(
+        self, id: int, limit: int, candidates: np.ndarray = None
+    ) -> list[tuple[int, float]]:
+        """
+        Cosine-nearest series to [id], optionally restricted to the [candidates] ids.
+        """
+
+        row = self.row_of(id)
+        if row is None:
+            return []
+
+        start, end = self.indptr[row], self.indptr[row + 1]
+        columns = self.columns[start:end]
+        values = self.values[start:end].astype(np.float32)
+        num_terms = self.max_query_terms
+        if len(columns) > num_terms:
+            keep = np.argpartition(-values, num_terms)[:num_terms]
+            columns, values = columns[keep], values[keep]
+
+        # scores = X @ q, summed over the postings of each query term
+        idx, lengths = _gather(self.col_indptr, columns)
+        scores = np.bincount(
+            self.col_rows[idx],
+            weights=self.col_values[idx] * np.repeat(values, lengths),
+            minlength=len(self.ids),
+        )
+
+        scores[row] = 0
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            rows = np.searchsorted(self.ids, candidates)
+            in_range = rows < len(self.ids)
+            rows, candidates = rows[in_range], candidates[in_range]
+
+            allowed = np.zeros(len(self.ids), dtype=bool)
+            allowed[rows[self.ids[rows] == candidates]] = True
+            scores[~allowed] = 0
+
+        limit = min(limit, np.count_nonzero(scores))
+        if limit <= 0:
+            return []
+
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return list(zip(self.ids[top].tolist(), scores[top].tolist()))
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import mmap
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"MUCAT001"
+# magic, header length
+PREAMBLE = struct.Struct("<8sQ")
+ALIGN = 64
+
+
+class StringColumn:
+    """
+    List of strings stored as one utf-8 buffer plus an offset table, so it can live in a snapshot.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets  # int64, len + 1
+        self.data = data  # uint8
+
+    @classmethod
+    def from_strings(cls, strings: list[str]) -> StringColumn:
+        encoded = [s.encode() for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, data)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.data[start:end].tobytes().decode()
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def save_snapshot(file: Path, meta: dict, **arrays: np.ndarray) -> None:
+    """
+    Write arrays into a single file that open_snapshot() can map without copying.
+    Layout is a json header (dtype / shape / offset of each array, plus [meta]) followed by the
+    raw arrays, each aligned to 64 bytes. Written atomically, so a reloading server never reads a partial file.
+    """
+
+    entries = dict()
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        offset = -(-offset // ALIGN) * ALIGN
+        entries[name] = dict(dtype=arr.dtype.str, shape=list(arr.shape), offset=offset)
+        offset += arr.nbytes
+
+    header = json.dumps(dict(meta=meta, arrays=entries)).encode()
+    data_start = -(-(PREAMBLE.size + len(header)) // ALIGN) * ALIGN
+
+    tmp_file = file.with_suffix(".tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + entries[name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(data_start + offset)
+    tmp_file.replace(file)
+
+
+def open_snapshot(file: Path) -> tuple[dict, dict[str, np.ndarray]]:
+    """
+    Map a snapshot read-only. The arrays are views into the page cache, so every process that opens
+    the same file shares one copy, and opening is instant no matter the size.
+    """
+
+    with open(file, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, header_size = PREAMBLE.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError(f"[{file}] is not a catalog snapshot")
+
+    header = json.loads(buf[PREAMBLE.size : PREAMBLE.size + header_size])
+    data_start = -(-(PREAMBLE.size + header_size) // ALIGN) * ALIGN
+
+    arrays = dict()
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        arr = np.frombuffer(
+            buf, dtype=dtype, count=count, offset=data_start + entry["offset"]
+        )
+        arrays[name] = arr.reshape(entry["shape"])
+
+    return header["meta"], arrays
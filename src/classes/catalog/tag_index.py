@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import reduce
+from typing import Iterable
+
+import numpy as np
+from classes.models import db
+from pony import orm
+
+from .snapshot import StringColumn
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+@dataclass
+class TagFilter:
+    # ids a series must be in (None if there are no include tags)
+    include: np.ndarray | None
+    # ids a series must not be in
+    exclude: np.ndarray
+
+    def apply(self, ids: Iterable[int]) -> np.ndarray:
+        """
+        Drop ids that don't pass the filter, keeping the original order.
+        """
+
+        ids = np.fromiter(ids, dtype=np.int64)
+        if self.include is not None:
+            ids = ids[np.isin(ids, self.include, assume_unique=True)]
+        if len(self.exclude):
+            ids = ids[~np.isin(ids, self.exclude, assume_unique=True)]
+        return ids
+
+
+class TagIndex:
+    """
+    Inverted index from genre / category name to the sorted ids of the series tagged with it.
+    Include / exclude filters reduce to intersections and differences of these arrays.
+    """
+
+    genres: dict[str, np.ndarray]
+    categories: dict[str, np.ndarray]
+
+    def __init__(
+        self, genres: dict[str, np.ndarray], categories: dict[str, np.ndarray]
+    ):
+        self.genres = genres
+        self.categories = categories
+
+    @classmethod
+    def from_rows(
+        cls,
+        genre_rows: Iterable[tuple[str, int]],
+        category_rows: Iterable[tuple[str, int]],
+    ) -> TagIndex:
+        return cls(cls._group(genre_rows), cls._group(category_rows))
+
+    @classmethod
+    def load(cls) -> TagIndex:
+        with orm.db_session:
+            genre_rows = orm.select(
+                [g.name, s.id] for g in db.entities["Genre"] for s in g.series
+            )[:]
+
+            category_rows = orm.select(
+                [c.type.name, c.series.id] for c in db.entities["Category"]
+            )[:]
+
+        return cls.from_rows(genre_rows, category_rows)
+
+    @staticmethod
+    def _group(pairs: Iterable[tuple[str, int]]) -> dict[str, np.ndarray]:
+        grouped: dict[str, list[int]] = defaultdict(list)
+        for name, id in pairs:
+            grouped[name].append(id)
+
+        return {
+            name: np.unique(np.array(ids, dtype=np.int64))
+            for name, ids in grouped.items()
+        }
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """
+        Flatten into CSR style arrays (names, indptr, ids) for a snapshot.
+        """
+
+        arrays = dict()
+        for kind, groups in [("genre", self.genres), ("category", self.categories)]:
+            names = StringColumn.from_strings(list(groups.keys()))
+            indptr = np.zeros(len(groups) + 1, dtype=np.int64)
+            np.cumsum([len(ids) for ids in groups.values()], out=indptr[1:])
+
+            arrays[f"{kind}_name_offsets"] = names.offsets
+            arrays[f"{kind}_name_data"] = names.data
+            arrays[f"{kind}_indptr"] = indptr
+            arrays[f"{kind}_ids"] = (
+                np.concatenate(list(groups.values())) if groups else EMPTY
+            )
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> TagIndex:
+        """
+        Inverse of to_arrays(). The id arrays are slices of the inputs, not copies.
+        """
+
+        groups = []
+        for kind in ["genre", "category"]:
+            names = StringColumn(
+                arrays[f"{kind}_name_offsets"], arrays[f"{kind}_name_data"]
+            )
+            indptr = arrays[f"{kind}_indptr"]
+            ids = arrays[f"{kind}_ids"]
+            groups.append(
+                {name: ids[indptr[i] : indptr[i + 1]] for i, name in enumerate(names)}
+            )
+        return cls(*groups)
+
+    def filter(
+        self,
+        genres: list[str] = None,
+        genres_exclude: list[str] = None,
+        categories: list[str] = None,
+        categories_exclude: list[str] = None,
+    ) -> TagFilter:
+        include = [self.genres.get(x, EMPTY) for x in genres or []]
+        include += [self.categories.get(x, EMPTY) for x in categories or []]
+        exclude = [self.genres.get(x, EMPTY) for x in genres_exclude or []]
+        exclude += [self.categories.get(x, EMPTY) for x in categories_exclude or []]
+
+        if exclude:
+            exclude = reduce(np.union1d, exclude)
+        else:
+            exclude = EMPTY
+
+        if not include:
+            return TagFilter(include=None, exclude=exclude)
+
+        # intersect smallest first so the working set shrinks as fast as possible
+        include = sorted(include, key=len)
+        include = reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), include)
+        include = np.setdiff1d(include, exclude, assume_unique=True)
+
+        return TagFilter(include=include, exclude=EMPTY)
+
+    def genre_counts(self) -> list[tuple[str, int]]:
+        return [(name, len(ids)) for name, ids in self.genres.items()]
+
+    def category_counts(self) -> list[tuple[str, int]]:
+        counts = [(name, len(ids)) for name, ids in self.categories.items()]
+        return sorted(counts, key=lambda x: x[1], reverse=True)
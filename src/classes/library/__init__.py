@@ -0,0 +1,11 @@
+from config import paths
+
+from .archive import ArchiveEntry, index_archive, read_entry
+from .derivatives import THUMBNAIL_WIDTH, DerivativeCache, bucket_width
+from .library import Chapter, Library
+from .readahead import PageCache, ReadAhead
+
+library = Library(paths.LIBRARY_DB_FILE)
+derivatives = DerivativeCache(paths.DERIVATIVE_DIR)
+page_cache = PageCache()
+readahead = ReadAhead(library, page_cache)
@@ -0,0 +1,106 @@
+import logging
+import os
+import re
+import struct
+import zipfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+IMAGE_SUFFIXES = {".avif", ".bmp", ".gif", ".jpeg", ".jpg", ".png", ".webp"}
+ARCHIVE_SUFFIXES = {".cbz", ".zip"}
+
+# signature, version, flags, method, mtime, mdate, crc, csize, usize, name len, extra len
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+
+
+@dataclass
+class ArchiveEntry:
+    """
+    Location of one page inside a zip, so it can be read with a single seek.
+    """
+
+    name: str
+    data_offset: int
+    compressed_size: int
+    file_size: int
+    compress_type: int
+
+    @property
+    def is_stored(self) -> bool:
+        return self.compress_type == zipfile.ZIP_STORED
+
+
+def natural_key(text: str) -> list:
+    """
+    Sort key that orders "page 2" before "page 10".
+    """
+
+    return [int(x) if x.isdigit() else x.casefold() for x in re.split(r"(\d+)", text)]
+
+
+def index_archive(file: Path) -> list[ArchiveEntry]:
+    """
+    Read the central directory of a zip once and resolve where each image's data starts.
+    Entries are returned in reading order.
+    """
+
+    entries = []
+    with zipfile.ZipFile(file) as zf, open(file, "rb") as f:
+        for info in zf.infolist():
+            if (
+                info.is_dir()
+                or Path(info.filename).suffix.lower() not in IMAGE_SUFFIXES
+            ):
+                continue
+            if info.flag_bits & 0x1:
+                logging.warning(
+                    f"Skipping encrypted entry [{info.filename}] in [{file}]"
+                )
+                continue
+
+            # the local header's name / extra fields can differ from the central directory's
+            f.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+            if header[0] != LOCAL_HEADER_SIGNATURE:
+                logging.warning(f"Bad local header for [{info.filename}] in [{file}]")
+                continue
+            name_len, extra_len = header[9], header[10]
+
+            entries.append(
+                ArchiveEntry(
+                    name=info.filename,
+                    data_offset=info.header_offset
+                    + LOCAL_HEADER.size
+                    + name_len
+                    + extra_len,
+                    compressed_size=info.compress_size,
+                    file_size=info.file_size,
+                    compress_type=info.compress_type,
+                )
+            )
+
+    entries.sort(key=lambda e: natural_key(e.name))
+    return entries
+
+
+def read_entry(file: Path, entry: ArchiveEntry) -> bytes:
+    """
+    Read (and inflate) a single entry without touching the rest of the archive.
+    """
+
+    if entry.compress_type not in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+        # bzip2 / lzma pages are rare, let zipfile handle them
+        with zipfile.ZipFile(file) as zf:
+            return zf.read(entry.name)
+
+    fd = os.open(file, os.O_RDONLY)
+    try:
+        raw = os.pread(fd, entry.compressed_size, entry.data_offset)
+    finally:
+        os.close(fd)
+
+    if entry.is_stored:
+        return raw
+    return zlib.decompress(raw, -zlib.MAX_WBITS)
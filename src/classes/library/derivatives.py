@@ -0,0 +1,183 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+from utils.metrics import CACHE_REQUESTS
+
+from .archive import ArchiveEntry, read_entry
+from .library import Chapter
+
+THUMBNAIL_WIDTH = 200
+
+# resized pages are only made in these widths, so clients asking for 700px and 720px share a file
+WIDTH_BUCKETS = [480, 720, 1080, 1440]
+
+
+def bucket_width(width: int) -> int:
+    for bucket in WIDTH_BUCKETS:
+        if width <= bucket:
+            return bucket
+    return WIDTH_BUCKETS[-1]
+
+
+def render(
+    archive: str, entry: ArchiveEntry, width: int, out_file: str, quality: int
+) -> int:
+    """
+    Decode a page, shrink it to [width] and write it as a jpeg. Runs in a worker process.
+    Returns the size of the written file.
+    """
+
+    from PIL import Image
+
+    data = read_entry(Path(archive), entry)
+    with Image.open(io.BytesIO(data)) as im:
+        # lets the jpeg decoder downscale by 1/2, 1/4, 1/8 for free
+        im.draft("RGB", (width, width * 16))
+        im = im.convert("RGB")
+        if im.width > width:
+            height = max(1, round(im.height * width / im.width))
+            im = im.resize((width, height), Image.LANCZOS)
+
+        # other server workers may be rendering the same file
+        tmp_file = f"{out_file}.{os.getpid()}.tmp"
+        im.save(tmp_file, "JPEG", quality=quality, optimize=True)
+        os.replace(tmp_file, out_file)
+
+    return os.path.getsize(out_file)
+
+
+class DerivativeCache:
+    """
+    Thumbnails and resized pages, generated in a process pool and kept on disk.
+    Concurrent requests for the same file share one render, and the least recently used files are evicted once
+    the cache dir grows past max_bytes.
+    """
+
+    quality = 80
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 2 * 1024**3, workers: int = 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+
+        self._executor: ProcessPoolExecutor | None = None
+        self._inflight: dict[Path, Future] = dict()
+        self._lock = threading.Lock()
+        self._size: int | None = None
+        self._evicting = False
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        return self._executor
+
+    def path_for(self, chapter: Chapter, page: int, width: int) -> Path:
+        # mtime in the name so a replaced archive never serves stale images
+        name = f"{page}_{width}_{int(chapter.mtime)}.jpg"
+        return self.cache_dir / str(chapter.id) / name
+
+    def get(
+        self, chapter: Chapter, page: int, entry: ArchiveEntry, width: int
+    ) -> Future:
+        """
+        Future resolving to the path of the derivative, rendering it if needed.
+        """
+
+        file = self.path_for(chapter, page, width)
+
+        with self._lock:
+            if file in self._inflight:
+                CACHE_REQUESTS.inc(cache="derivative", result="inflight")
+                return self._inflight[file]
+
+            if file.exists():
+                CACHE_REQUESTS.inc(cache="derivative", result="hit")
+                # bump mtime so eviction treats this as recently used
+                os.utime(file)
+                future = Future()
+                future.set_result(file)
+                return future
+
+            CACHE_REQUESTS.inc(cache="derivative", result="miss")
+            file.parent.mkdir(parents=True, exist_ok=True)
+            inner = self.executor.submit(
+                render, chapter.path, entry, width, str(file), self.quality
+            )
+
+            future = Future()
+            self._inflight[file] = future
+
+        inner.add_done_callback(lambda f: self._on_rendered(file, f, future))
+        return future
+
+    def _on_rendered(self, file: Path, inner: Future, future: Future) -> None:
+        with self._lock:
+            self._inflight.pop(file, None)
+
+        error = inner.exception()
+        if error is not None:
+            logging.error(f"Failed to render [{file}]")
+            logging.exception(error)
+            future.set_exception(error)
+            return
+
+        future.set_result(file)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += inner.result()
+
+            over = self._size is None or self._size > self.max_bytes
+            if over and not self._evicting:
+                self._evicting = True
+                threading.Thread(target=self.evict, daemon=True).start()
+
+    def pregenerate(
+        self, chapter: Chapter, entries: list[ArchiveEntry], widths: list[int] = None
+    ) -> list[Future]:
+        widths = widths or [THUMBNAIL_WIDTH]
+        return [
+            self.get(chapter, page, entry, width)
+            for page, entry in enumerate(entries)
+            for width in widths
+        ]
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used files until the cache fits in max_bytes.
+        """
+
+        try:
+            self._evict()
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _evict(self) -> None:
+        files = []
+        for f in self.cache_dir.rglob("*.jpg"):
+            try:
+                stat = f.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, f))
+
+        size = sum(x[1] for x in files)
+        if size > self.max_bytes:
+            files.sort()
+            # overshoot a little so we're not evicting on every render
+            target = self.max_bytes * 0.9
+            for _, file_size, f in files:
+                if size <= target:
+                    break
+                f.unlink(missing_ok=True)
+                size -= file_size
+            logging.info(f"Evicted derivatives down to {size / 1024**2:.0f}MB")
+
+        with self._lock:
+            self._size = size
@@ -0,0 +1,273 @@
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from classes.models.lookups import match_series_ids
+from pony import orm
+
+from .archive import ARCHIVE_SUFFIXES, ArchiveEntry, index_archive, natural_key
+
+
+@dataclass
+class Chapter:
+    id: int
+    folder: str
+    path: str
+    name: str
+    position: int
+    size: int
+    mtime: float
+
+
+class Library:
+    """
+    Local chapter files (the symlinked series folders) and the page index of each archive.
+    Kept in its own sqlite file since the app db is rebuilt on every import.
+    """
+
+    # chapters whose page index is kept in memory
+    cache_size = 256
+
+    def __init__(self, db_file: Path):
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        # chapter id -> (archive mtime, entries), the mtime catches archives replaced by a scan in another process
+        self._pages: OrderedDict[int, tuple[float, list[ArchiveEntry]]] = OrderedDict()
+
+        with self.lock:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS folders (
+                    path            TEXT            PRIMARY KEY,
+                    series_id       INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS folders_series ON folders (series_id);
+
+                CREATE TABLE IF NOT EXISTS chapters (
+                    id              INTEGER         PRIMARY KEY,
+                    folder          TEXT            NOT NULL,
+                    path            TEXT            NOT NULL UNIQUE,
+                    name            TEXT            NOT NULL,
+                    position        INTEGER         NOT NULL,
+                    size            INTEGER         NOT NULL,
+                    mtime           REAL            NOT NULL,
+                    indexed         INTEGER         NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS chapters_folder ON chapters (folder, position);
+
+                CREATE TABLE IF NOT EXISTS pages (
+                    chapter_id      INTEGER         NOT NULL,
+                    idx             INTEGER         NOT NULL,
+                    name            TEXT            NOT NULL,
+                    data_offset     INTEGER         NOT NULL,
+                    compressed_size INTEGER         NOT NULL,
+                    file_size       INTEGER         NOT NULL,
+                    compress_type   INTEGER         NOT NULL,
+                    PRIMARY KEY (chapter_id, idx)
+                ) WITHOUT ROWID;
+                """)
+
+    ### scanning
+
+    def scan(self, series_dirs: list[Path]) -> list[int]:
+        """
+        Sync the folder / chapter tables with what's on disk.
+        Page indexes are built lazily, on first read of each chapter.
+        Returns the ids of the chapters that were added or changed.
+        """
+
+        seen = set()
+        changed = []
+        for series_dir in series_dirs:
+            for folder in sorted(series_dir.iterdir()):
+                if not folder.is_dir():
+                    continue
+
+                changed.extend(self._scan_folder(folder))
+                seen.add(str(folder))
+
+        with self.lock, self.db:
+            for (path,) in self.db.execute("SELECT path FROM folders").fetchall():
+                if path not in seen:
+                    logging.info(f"Dropping missing folder [{path}]")
+                    self._delete_folder(path)
+
+        return changed
+
+    def _scan_folder(self, folder: Path) -> list[int]:
+        with orm.db_session:
+            series_ids = match_series_ids(folder.name)
+        if len(series_ids) != 1:
+            logging.warning(f"Found {len(series_ids)} series matching [{folder.name}]")
+        series_id = series_ids[0] if len(series_ids) == 1 else None
+
+        files = [f for f in folder.iterdir() if f.suffix.lower() in ARCHIVE_SUFFIXES]
+        files.sort(key=lambda f: natural_key(f.name))
+
+        changed = []
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO folders VALUES (?, ?)", (str(folder), series_id)
+            )
+
+            known = {
+                path: (id, size, mtime)
+                for id, path, size, mtime in self.db.execute(
+                    "SELECT id, path, size, mtime FROM chapters WHERE folder = ?",
+                    (str(folder),),
+                )
+            }
+
+            for position, f in enumerate(files):
+                stat = f.stat()
+                prev = known.pop(str(f), None)
+                if prev is None:
+                    cursor = self.db.execute(
+                        "INSERT INTO chapters (folder, path, name, position, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            str(folder),
+                            str(f),
+                            f.stem,
+                            position,
+                            stat.st_size,
+                            stat.st_mtime,
+                        ),
+                    )
+                    changed.append(cursor.lastrowid)
+                elif prev[1:] != (stat.st_size, stat.st_mtime):
+                    # archive changed, so its page index is stale
+                    self._delete_pages(prev[0])
+                    self.db.execute(
+                        "UPDATE chapters SET position = ?, size = ?, mtime = ?, indexed = 0 WHERE id = ?",
+                        (position, stat.st_size, stat.st_mtime, prev[0]),
+                    )
+                    changed.append(prev[0])
+                else:
+                    self.db.execute(
+                        "UPDATE chapters SET position = ? WHERE id = ?",
+                        (position, prev[0]),
+                    )
+
+            for id, _, _ in known.values():
+                self._delete_pages(id)
+                self.db.execute("DELETE FROM chapters WHERE id = ?", (id,))
+
+        return changed
+
+    def _delete_pages(self, chapter_id: int) -> None:
+        self.db.execute("DELETE FROM pages WHERE chapter_id = ?", (chapter_id,))
+        self._pages.pop(chapter_id, None)
+
+    def _delete_folder(self, path: str) -> None:
+        ids = self.db.execute("SELECT id FROM chapters WHERE folder = ?", (path,))
+        for (id,) in ids.fetchall():
+            self._delete_pages(id)
+        self.db.execute("DELETE FROM chapters WHERE folder = ?", (path,))
+        self.db.execute("DELETE FROM folders WHERE path = ?", (path,))
+
+    ### lookups
+
+    def chapters(self, series_id: int) -> list[Chapter]:
+        with self.lock:
+            rows = self.db.execute(
+                """
+                SELECT c.id, c.folder, c.path, c.name, c.position, c.size, c.mtime
+                FROM chapters c JOIN folders f ON c.folder = f.path
+                WHERE f.series_id = ?
+                ORDER BY c.folder, c.position
+                """,
+                (series_id,),
+            ).fetchall()
+        return [Chapter(*r) for r in rows]
+
+    def chapter(self, chapter_id: int) -> Chapter | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, folder, path, name, position, size, mtime FROM chapters WHERE id = ?",
+                (chapter_id,),
+            ).fetchone()
+        return Chapter(*row) if row else None
+
+    def next_chapter(self, chapter: Chapter) -> Chapter | None:
+        with self.lock:
+            row = self.db.execute(
+                """
+                SELECT id, folder, path, name, position, size, mtime FROM chapters
+                WHERE folder = ? AND position > ?
+                ORDER BY position LIMIT 1
+                """,
+                (chapter.folder, chapter.position),
+            ).fetchone()
+        return Chapter(*row) if row else None
+
+    def pages(self, chapter: Chapter) -> list[ArchiveEntry] | None:
+        """
+        Page index of a chapter, built from the archive's central directory on first use.
+        None if the chapter is gone, eg dropped by a rescan.
+        """
+
+        with self.lock:
+            cached = self._pages.get(chapter.id)
+            if cached is not None and cached[0] == chapter.mtime:
+                self._pages.move_to_end(chapter.id)
+                return cached[1]
+
+            row = self.db.execute(
+                "SELECT indexed FROM chapters WHERE id = ?", (chapter.id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0]:
+                rows = self.db.execute(
+                    """
+                    SELECT name, data_offset, compressed_size, file_size, compress_type
+                    FROM pages WHERE chapter_id = ? ORDER BY idx
+                    """,
+                    (chapter.id,),
+                ).fetchall()
+                entries = [ArchiveEntry(*r) for r in rows]
+                self._remember(chapter, entries)
+                return entries
+
+        # reading the archive can be slow, so do it outside the lock
+        entries = index_archive(Path(chapter.path))
+
+        with self.lock, self.db:
+            # a rescan may have dropped the chapter meanwhile
+            row = self.db.execute(
+                "SELECT 1 FROM chapters WHERE id = ?", (chapter.id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._delete_pages(chapter.id)
+            self.db.executemany(
+                "INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        chapter.id,
+                        idx,
+                        e.name,
+                        e.data_offset,
+                        e.compressed_size,
+                        e.file_size,
+                        e.compress_type,
+                    )
+                    for idx, e in enumerate(entries)
+                ],
+            )
+            self.db.execute(
+                "UPDATE chapters SET indexed = 1 WHERE id = ?", (chapter.id,)
+            )
+            self._remember(chapter, entries)
+
+        return entries
+
+    def _remember(self, chapter: Chapter, entries: list[ArchiveEntry]) -> None:
+        self._pages[chapter.id] = (chapter.mtime, entries)
+        self._pages.move_to_end(chapter.id)
+        while len(self._pages) > self.cache_size:
+            self._pages.popitem(last=False)
@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.metrics import CACHE_REQUESTS
+
+from .archive import ArchiveEntry, read_entry
+from .library import Chapter, Library
+
+# (chapter id, archive mtime, page index), the mtime so a replaced archive never serves the old pages
+PageKey = tuple[int, float, int]
+
+
+class PageCache:
+    """
+    Bounded LRU of page bytes, keyed by PageKey.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024**2):
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self._data: OrderedDict[PageKey, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: PageKey) -> bool:
+        return key in self._data
+
+    def get(self, key: PageKey) -> bytes | None:
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
+                CACHE_REQUESTS.inc(cache="page", result="miss")
+                return None
+
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="page", result="hit")
+            self._data.move_to_end(key)
+            return data
+
+    def put(self, key: PageKey, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+            self._data[key] = data
+            self.size += len(data)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class ReadAhead:
+    """
+    Warms the pages a reader is about to turn to.
+    Compressed pages are inflated into the PageCache. Stored pages are served straight from the archive, so for those
+    the kernel is asked to pull the byte range into the OS page cache instead (posix_fadvise), falling back to the
+    PageCache where that isn't available.
+    """
+
+    def __init__(
+        self,
+        library: Library,
+        cache: PageCache,
+        pages: int = 4,
+        next_chapter_pages: int = 3,
+        workers: int = 2,
+    ):
+        self.library = library
+        self.cache = cache
+        self.pages = pages
+        self.next_chapter_pages = next_chapter_pages
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="readahead")
+        self._pending: set[PageKey] = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, chapter: Chapter, page: int) -> None:
+        """
+        Called when [page] of [chapter] is requested, returns immediately.
+        """
+
+        if self.pages <= 0:
+            return
+        self._executor.submit(self._plan, chapter, page)
+
+    def _plan(self, chapter: Chapter, page: int) -> None:
+        try:
+            entries = self.library.pages(chapter)
+            if entries is None:
+                return
+            for idx in range(page + 1, min(page + 1 + self.pages, len(entries))):
+                self._submit(chapter, idx, entries[idx])
+
+            # close to the end, so start on the next chapter too
+            if page + self.pages >= len(entries) - 1:
+                next_chapter = self.library.next_chapter(chapter)
+                if next_chapter is not None:
+                    next_entries = self.library.pages(next_chapter) or []
+                    for idx, entry in enumerate(
+                        next_entries[: self.next_chapter_pages]
+                    ):
+                        self._submit(next_chapter, idx, entry)
+        except Exception as e:
+            logging.warning(f"Read-ahead failed for [{chapter.path}]")
+            logging.exception(e)
+
+    def _submit(self, chapter: Chapter, idx: int, entry: ArchiveEntry) -> None:
+        key = (chapter.id, chapter.mtime, idx)
+        with self._lock:
+            if key in self._pending or key in self.cache:
+                return
+            self._pending.add(key)
+
+        self._executor.submit(self._warm, chapter, idx, entry)
+
+    def _warm(self, chapter: Chapter, idx: int, entry: ArchiveEntry) -> None:
+        key = (chapter.id, chapter.mtime, idx)
+        try:
+            if entry.is_stored and hasattr(os, "posix_fadvise"):
+                fd = os.open(chapter.path, os.O_RDONLY)
+                try:
+                    os.posix_fadvise(
+                        fd,
+                        entry.data_offset,
+                        entry.compressed_size,
+                        os.POSIX_FADV_WILLNEED,
+                    )
+                finally:
+                    os.close(fd)
+            else:
+                self.cache.put(key, read_entry(Path(chapter.path), entry))
+        except OSError as e:
+            logging.warning(f"Failed to warm page {idx} of [{chapter.path}]: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
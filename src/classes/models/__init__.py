@@ -1,12 +1,58 @@
+import threading
+import time
+from typing import Callable
+
 from config import paths
-from pony.orm import Database
+from pony import orm
+from utils.data_version import current_data_version
+
+# callbacks run after every sql statement, with (sql, arguments, seconds taken)
+sql_hooks: list[Callable[[str, object, float], None]] = []
+
+
+class InstrumentedDatabase(orm.Database):
+    """
+    Pony database that reports each statement to the sql_hooks.
+    Note that sqlite only runs a query up to its first row on execute, so times exclude fetching the rest.
+
+    Also reconnects after the importer publishes a new db file (see utils.publish_db). Connections are per-thread,
+    so each thread drops its own at the start of its next db_session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._local = threading.local()
+
+    def _get_cache(self):
+        # no cache means no session is using the connection yet, so it's safe to drop
+        if self.provider is not None and orm.core.local.db2cache.get(self) is None:
+            version = current_data_version()
+            if getattr(self._local, "version", version) != version:
+                self.provider.disconnect()
+            self._local.version = version
+
+        return super()._get_cache()
+
+    def _exec_sql(self, sql, arguments=None, *args, **kwargs):
+        if not sql_hooks:
+            return super()._exec_sql(sql, arguments, *args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return super()._exec_sql(sql, arguments, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            for hook in sql_hooks:
+                hook(sql, arguments, elapsed)
+
 
 # init db
-db = Database()
+db = InstrumentedDatabase()
+
 
-# make db queries case insensitive
+# make db queries case insensitive (ascii only, titles should be matched on Title.normalized instead)
 @db.on_connect(provider="sqlite")
-def sqlite_case_sensitivity(db: Database, connection):
+def sqlite_case_sensitivity(db: orm.Database, connection):
     cursor = connection.cursor()
     cursor.execute("PRAGMA case_sensitive_like = OFF")
 
@@ -0,0 +1,23 @@
+from pony import orm
+from utils.text import normalize_title
+
+from . import db
+
+
+def match_series_ids(name: str) -> list[int]:
+    """
+    Ids of the series with a title that normalizes to the same string as [name].
+    This is an index lookup on Title.normalized, so it's cheap enough to run per folder / request.
+    Must be called inside a db_session.
+    """
+
+    normalized = normalize_title(name)
+    if not normalized:
+        return []
+
+    # a plain list, pony's QueryResult isn't json serializable
+    return list(
+        orm.select(
+            t.series.id for t in db.entities["Title"] if t.normalized == normalized
+        )
+    )
@@ -11,7 +11,7 @@ class Series(db.Entity):
     completed = Required(bool)
     description = Optional(str)
     forum_id = Required(int, size=64)
-    last_updated = Required(float)
+    last_updated = Required(float, index=True)
     latest_chapter = Required(float)
     licensed = Required(bool)
     name = Required(str)
@@ -19,6 +19,13 @@ class Series(db.Entity):
     status = Optional(str)
     year = Optional(int)
 
+    # sort columns derived from the rank at import
+    composite_score = Optional(float, index=True)
+    popularity = Optional(int, index=True)
+    trending = Optional(float, index=True)
+    # lowest series id of the franchise (connected relations), see classes.catalog.FranchiseIndex
+    franchise_id = Optional(int, size=64, index=True)
+
     anime = Optional("Anime")
     authors = Set("SeriesAuthor")
     categories = Set("Category")
@@ -36,8 +43,6 @@ class Series(db.Entity):
     titles = Set("Title")
     type = Required("Type")
 
-    folders = Set("SeriesFolder")
-
 
 class Anime(db.Entity):
     start = Required(str)
@@ -52,6 +57,8 @@ class Author(db.Entity):
     id = PrimaryKey(int, auto=False, size=64)
 
     name = Required(str)
+    # utils.text.normalize_title(name), for name lookups
+    normalized = Optional(str, index=True)
 
     series = Set("SeriesAuthor")
 
@@ -116,6 +123,8 @@ class Publisher(db.Entity):
     id = PrimaryKey(int, auto=False, size=64)
 
     name = Required(str)
+    # utils.text.normalize_title(name), for name lookups
+    normalized = Optional(str, index=True)
 
     publications = Set(Publication)
     series = Set("SeriesPublisher")
@@ -177,6 +186,8 @@ class SeriesAuthor(db.Entity):
     series = Required(Series)
 
     composite_key(type, name, author, series)
+    # series list of an author is a range on this, plus a primary key lookup per series
+    composite_index(author, series)
 
 
 class SeriesPublisher(db.Entity):
@@ -187,10 +198,15 @@ class SeriesPublisher(db.Entity):
     publisher_type = Required(PublisherType)
 
     composite_key(series, publisher, publisher_type)
+    # series list of a publisher is a range on this, plus a primary key lookup per series
+    composite_index(publisher, series)
 
 
 class Title(db.Entity):
     name = Required(str)
+    # utils.text.normalize_title(name), may be empty for all-punctuation titles.
+    # Indexed for exact lookups (/series/match), the search title filter matches substrings and scans it
+    normalized = Optional(str, index=True)
 
     series = Required(Series)
 
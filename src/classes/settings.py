@@ -1,5 +1,6 @@
+import logging
 from pathlib import Path
-from typing import TypedDict, cast
+from typing import NotRequired, TypedDict, cast
 
 import toml
 from config import paths
@@ -7,16 +8,95 @@ from config import paths
 
 class SettingsInterface(TypedDict):
     series_dirs: list[str]
+    catalog: NotRequired[bool]
+    derivative_cache_mb: NotRequired[int]
+    derivative_workers: NotRequired[int]
+    sprite_cache_mb: NotRequired[int]
+    readahead_pages: NotRequired[int]
+    readahead_next_chapter_pages: NotRequired[int]
+    page_cache_mb: NotRequired[int]
+    admin_token: NotRequired[str]
+    slow_query_ms: NotRequired[int]
+    db_maintenance_hours: NotRequired[float]
+    admission_pools: NotRequired[dict[str, dict]]
+    admission_routes: NotRequired[dict[str, str]]
+    log_format: NotRequired[str]
+    log_max_mb: NotRequired[int]
+    log_backups: NotRequired[int]
+    log_rotate_when: NotRequired[str]
+    log_retention_days: NotRequired[int]
+    log_levels: NotRequired[dict[str, str]]
 
 
 class Settings:
     series_dirs: list[Path]
+    # false when a series dir is missing, see validate()
+    scan_enabled: bool
+
+    # keep an in-memory copy of the catalog for search / facets
+    catalog: bool
+
+    # thumbnails / resized pages
+    derivative_cache_mb: int
+    derivative_workers: int
+
+    # cover sprite sheets for grid pages
+    sprite_cache_mb: int
+
+    # pages warmed ahead of the reader, 0 to disable
+    readahead_pages: int
+    readahead_next_chapter_pages: int
+    page_cache_mb: int
+
+    # sent as the X-Admin-Token header to use the /admin routes, empty to disable them
+    admin_token: str
+
+    # log sql statements slower than this, 0 to disable
+    slow_query_ms: int
+
+    # record query shapes (for tools/db_maintenance.py advise) and db stats this often, 0 to disable
+    db_maintenance_hours: float
+
+    # pool name -> {concurrency, queue, timeout}, merged over classes.app.admission.DEFAULT_POOLS
+    admission_pools: dict[str, dict]
+    # route template -> pool name ("" for no limit), merged over DEFAULT_ROUTES
+    admission_routes: dict[str, str]
+
+    # "text" or "json" (one object per line)
+    log_format: str
+    # log files rotate at log_max_mb, or on a schedule if log_rotate_when is set (eg "midnight", see TimedRotatingFileHandler)
+    log_max_mb: int
+    log_backups: int
+    log_rotate_when: str
+    # log files untouched for this long are deleted on startup, 0 to keep forever
+    log_retention_days: int
+    # logger name -> level, eg {root = "INFO", slow_query = "WARNING"}
+    log_levels: dict[str, str]
 
     def __init__(self, data: SettingsInterface):
         self.series_dirs = []
         for x in data["series_dirs"]:
             self.series_dirs.append(Path(x))
 
+        self.catalog = data.get("catalog", True)
+        self.derivative_cache_mb = data.get("derivative_cache_mb", 2048)
+        self.derivative_workers = data.get("derivative_workers", 2)
+        self.sprite_cache_mb = data.get("sprite_cache_mb", 256)
+        self.readahead_pages = data.get("readahead_pages", 4)
+        self.readahead_next_chapter_pages = data.get("readahead_next_chapter_pages", 3)
+        self.page_cache_mb = data.get("page_cache_mb", 256)
+        self.admin_token = data.get("admin_token", "")
+        self.slow_query_ms = data.get("slow_query_ms", 0)
+        self.db_maintenance_hours = data.get("db_maintenance_hours", 0)
+        self.admission_pools = data.get("admission_pools", dict())
+        self.admission_routes = data.get("admission_routes", dict())
+        self.log_format = data.get("log_format", "text")
+        self.log_max_mb = data.get("log_max_mb", 10)
+        self.log_backups = data.get("log_backups", 5)
+        self.log_rotate_when = data.get("log_rotate_when", "")
+        self.log_retention_days = data.get("log_retention_days", 14)
+        self.log_levels = data.get("log_levels", dict())
+
         self.validate()
 
     @classmethod
@@ -26,16 +106,41 @@ class Settings:
         return Settings(data)
 
     def dump(self) -> None:
-        data = dict(series_dirs=[str(x) for x in self.series_dirs])
+        data = dict(
+            series_dirs=[str(x) for x in self.series_dirs],
+            catalog=self.catalog,
+            derivative_cache_mb=self.derivative_cache_mb,
+            derivative_workers=self.derivative_workers,
+            sprite_cache_mb=self.sprite_cache_mb,
+            readahead_pages=self.readahead_pages,
+            readahead_next_chapter_pages=self.readahead_next_chapter_pages,
+            page_cache_mb=self.page_cache_mb,
+            admin_token=self.admin_token,
+            slow_query_ms=self.slow_query_ms,
+            db_maintenance_hours=self.db_maintenance_hours,
+            admission_pools=self.admission_pools,
+            admission_routes=self.admission_routes,
+            log_format=self.log_format,
+            log_max_mb=self.log_max_mb,
+            log_backups=self.log_backups,
+            log_rotate_when=self.log_rotate_when,
+            log_retention_days=self.log_retention_days,
+            log_levels=self.log_levels,
+        )
         toml.dump(data, open(paths.CONFIG_DIR / "settings.toml", "w"))
 
     def validate(self) -> bool:
         """
         Validate each attr.
+        Missing series dirs aren't fatal, only library scanning needs them.
         """
 
-        for x in self.series_dirs:
-            if not x.exists():
-                raise ValueError
+        missing = [x for x in self.series_dirs if not x.exists()]
+        # scanning with a dir missing (eg an unmounted drive) would drop every chapter in it
+        self.scan_enabled = len(missing) == 0
+        if missing:
+            logging.warning(
+                f"Series dirs not found, library scanning disabled: {missing}"
+            )
 
         return True
@@ -7,16 +7,29 @@ CACHE_DIR = SRC_DIR / "cache"
 CONFIG_DIR = SRC_DIR / "config"
 DATA_DIR = SRC_DIR / "data"
 
+INDEX_DIR = DATA_DIR / "indexes"
+# the importer writes indexes here, publish_db() moves them into INDEX_DIR along with the db
+INDEX_BUILD_DIR = DATA_DIR / "indexes.build"
+
 LOG_DIR = CACHE_DIR / "logs"
 COVER_DIR = CACHE_DIR / "covers"
+DERIVATIVE_DIR = CACHE_DIR / "derivatives"
+SPRITE_DIR = CACHE_DIR / "sprites"
 
 DB_FILE = DATA_DIR / "db.sqlite"
+# the importer builds here, then swaps it in for DB_FILE
+DB_BUILD_FILE = DATA_DIR / "db.build.sqlite"
+DATA_VERSION_FILE = DATA_DIR / "version"
+LIBRARY_DB_FILE = DATA_DIR / "library.sqlite"
 
 for p in [
     CACHE_DIR,
     COVER_DIR,
+    DERIVATIVE_DIR,
+    SPRITE_DIR,
     CONFIG_DIR,
     DATA_DIR,
+    INDEX_DIR,
     LOG_DIR,
 ]:
     if not p.exists():
@@ -1,12 +1,14 @@
 import uvicorn
 
 from classes.models import db
-from classes.app import app
+from classes.app import app, settings
 from config import paths
 from utils.logging import configure_logging
 
-# setup logging
-configure_logging()
+# setup logging, in the process that serves requests (not the reloader, which would share the log file).
+# One file per worker, so they don't rotate each other's files
+if __name__ != "__main__":
+    configure_logging("server", settings, per_process=True)
 
 # setup db
 if db.provider is None:
@@ -0,0 +1,44 @@
+import atexit
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import paths
+
+# point every data / cache path at a scratch dir before anything binds the db
+_tmp_dir = Path(tempfile.mkdtemp(prefix="mu_reader_test_"))
+atexit.register(shutil.rmtree, _tmp_dir, ignore_errors=True)
+paths.CACHE_DIR = _tmp_dir / "cache"
+paths.DATA_DIR = _tmp_dir / "data"
+paths.INDEX_DIR = paths.DATA_DIR / "indexes"
+paths.INDEX_BUILD_DIR = paths.DATA_DIR / "indexes.build"
+paths.LOG_DIR = paths.CACHE_DIR / "logs"
+paths.COVER_DIR = paths.CACHE_DIR / "covers"
+paths.DERIVATIVE_DIR = paths.CACHE_DIR / "derivatives"
+paths.SPRITE_DIR = paths.CACHE_DIR / "sprites"
+paths.DB_FILE = paths.DATA_DIR / "db.sqlite"
+paths.DB_BUILD_FILE = paths.DATA_DIR / "db.build.sqlite"
+paths.DATA_VERSION_FILE = paths.DATA_DIR / "version"
+paths.LIBRARY_DB_FILE = paths.DATA_DIR / "library.sqlite"
+for p in [
+    paths.COVER_DIR,
+    paths.DERIVATIVE_DIR,
+    paths.SPRITE_DIR,
+    paths.INDEX_DIR,
+    paths.LOG_DIR,
+]:
+    p.mkdir(parents=True, exist_ok=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from classes.app import app
+    from fastapi.testclient import TestClient
+
+    # no context manager, so the startup hooks (catalog loading, maintenance) don't run
+    return TestClient(app)
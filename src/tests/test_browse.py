@@ -0,0 +1,27 @@
+import pytest
+from classes.models import db
+from pony import orm
+from utils.text import normalize_title
+
+
+@pytest.fixture(scope="module", autouse=True)
+def authors():
+    Author = db.entities["Author"]
+
+    with orm.db_session:
+        # the last two continue the prefix with a character outside the bmp (cjk ext-b, emoji)
+        for id, name in [(101, "Tanaka"), (102, "Tanaka𠀋"), (103, "Tanaka🙂")]:
+            Author(id=id, name=name, normalized=normalize_title(name))
+
+    yield
+
+    with orm.db_session:
+        Author.select().delete(bulk=True)
+
+
+def test_find_authors_by_prefix(client):
+    resp = client.get("/authors", params=dict(name="tanaka"))
+    assert resp.status_code == 200
+    ids = [x["id"] for x in resp.json()]
+    assert ids[0] == 101
+    assert sorted(ids) == [101, 102, 103]
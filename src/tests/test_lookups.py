@@ -0,0 +1,72 @@
+import pytest
+from classes.models import db
+from pony import orm
+from utils.text import normalize_title
+
+
+@pytest.fixture(scope="module", autouse=True)
+def series():
+    Series, Title, Type = (db.entities[x] for x in ["Series", "Title", "Type"])
+    Author, AuthorType, SeriesAuthor = (
+        db.entities[x] for x in ["Author", "AuthorType", "SeriesAuthor"]
+    )
+
+    with orm.db_session:
+        manga = Type.get(name="Manga") or Type(name="Manga")
+        author_type = AuthorType.get(name="Author") or AuthorType(name="Author")
+        authors = [(1, "Isayama Hajime"), (2, "ＯＤＡ Éiichiro")]
+        for id, name in [(1, "Shingeki no Kyojin"), (2, "Ｏｎｅ Ｐｉｅｃｅ")]:
+            s = Series(
+                id=id,
+                name=name,
+                completed=False,
+                forum_id=id,
+                last_updated=0,
+                latest_chapter=0,
+                licensed=False,
+                rating_votes=0,
+                type=manga,
+            )
+            Title(name=name, normalized=normalize_title(name), series=s)
+
+            author_id, author_name = authors[id - 1]
+            author = Author(
+                id=author_id, name=author_name, normalized=normalize_title(author_name)
+            )
+            SeriesAuthor(type=author_type, name=author_name, author=author, series=s)
+
+    yield
+
+    with orm.db_session:
+        for entity in [SeriesAuthor, Author, Title, Series]:
+            entity.select().delete(bulk=True)
+
+
+def test_match_hit(client):
+    resp = client.get("/series/match", params=dict(name="shingeki no kyojin"))
+    assert resp.status_code == 200
+    assert resp.json() == [1]
+
+
+def test_match_normalizes_width(client):
+    resp = client.get("/series/match", params=dict(name="One Piece"))
+    assert resp.status_code == 200
+    assert resp.json() == [2]
+
+
+def test_match_miss(client):
+    resp = client.get("/series/match", params=dict(name="not a series"))
+    assert resp.status_code == 200
+    assert resp.json() == []
+
+
+def test_author_filter_normalizes(client):
+    resp = client.get("/series/search", params=dict(author="oda eiichiro"))
+    assert resp.status_code == 200
+    assert resp.json() == [2]
+
+
+def test_author_filter_empty(client):
+    resp = client.get("/series/search", params=dict(author="-"))
+    assert resp.status_code == 200
+    assert sorted(resp.json()) == [1, 2]
@@ -0,0 +1,46 @@
+import itertools
+
+import pytest
+from classes.app.streaming import iter_query
+from classes.models import db
+from pony import orm
+
+
+@pytest.fixture(scope="module", autouse=True)
+def series():
+    Series, Type = db.entities["Series"], db.entities["Type"]
+
+    with orm.db_session:
+        manga = Type.get(name="Manga") or Type(name="Manga")
+        for id in range(10, 30):
+            Series(
+                id=id,
+                name=f"Series {id}",
+                year=2000 + id % 7,
+                completed=False,
+                forum_id=id,
+                last_updated=0,
+                latest_chapter=0,
+                licensed=id % 2 == 0,
+                rating_votes=0,
+                type=manga,
+            )
+
+    yield
+
+    with orm.db_session:
+        Series.select().delete(bulk=True)
+
+
+# iter_query compiles the query through a private pony api, this catches a pony upgrade changing it
+@pytest.mark.parametrize("limit, offset", [(None, None), (5, None), (5, 3)])
+def test_iter_query_matches_pony(limit, offset):
+    with orm.db_session:
+        query = orm.select(
+            s.id for s in db.entities["Series"] if s.year >= 2003 and s.licensed
+        ).order_by(lambda id: orm.desc(id))
+        expected = query.fetch(limit, offset) if limit else query[:]
+        chunks = iter_query(query, limit=limit, offset=offset, size=2)
+
+    assert list(itertools.chain.from_iterable(chunks)) == list(expected)
+    assert len(expected) > 0
@@ -5,24 +5,45 @@ from typing import TypeVar
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-import json
 import logging
 import re
-import sqlite3
+import shutil
 
-from classes.models import db, mu_models
 from config import paths
+
+# build into a fresh file so the server keeps reading the old db until this one is done, see publish_db() below
+published_db_file = paths.DB_FILE
+paths.DB_BUILD_FILE.unlink(missing_ok=True)
+paths.DB_FILE = paths.DB_BUILD_FILE
+# same for the indexes, which have to match the db they were built from
+shutil.rmtree(paths.INDEX_BUILD_DIR, ignore_errors=True)
+paths.INDEX_BUILD_DIR.mkdir(parents=True)
+
+from classes.catalog import (
+    Catalog,
+    CategoryMatrix,
+    CategoryVectors,
+    FranchiseIndex,
+    PrefixIndex,
+    RecommendationGraph,
+    RelationGraph,
+)
+from classes.models import db, mu_models
+from classes.settings import Settings
 from pony import orm
+from utils import publish_db
 from utils.logging import configure_logging
+from utils.raw_db import RawDb
+from utils.ranking import composite_score, popularity_score, trending_score
+from utils.text import normalize_title
 
 ###
 
-configure_logging(lambda d: f"insert_mu_{d['time']}_{d['pid']}.log")
+configure_logging("insert_mu", Settings.load())
 
 ###
 
-raw_db_file = paths.DATA_DIR / "raw_mu.sqlite"
-raw_db = sqlite3.connect(raw_db_file)
+raw_db = RawDb(paths.DATA_DIR / "raw_mu.sqlite")
 
 ###
 
@@ -71,9 +92,7 @@ def upsert(cls: T, key: dict, data: dict = None) -> T:
 
 ###
 
-data = raw_db.execute("SELECT data FROM series")
-data = [r[0] for r in data.fetchall()]
-data = [json.loads(r) for r in data]
+data = list(raw_db.all())
 
 
 print(f"Found {len(data)} series.")
@@ -98,6 +117,9 @@ def main():
             except:
                 year = None
 
+            popularity = popularity_score(r["rank"]["lists"])
+            trending = trending_score(r["rank"]["position"], r["rank"]["old_position"])
+
             series = upsert(
                 mu_models.Series,
                 dict(
@@ -116,6 +138,11 @@ def main():
                     status=r["status"] or "",
                     year=year,
                     type=typ,
+                    composite_score=composite_score(
+                        r["bayesian_rating"], popularity, trending
+                    ),
+                    popularity=popularity,
+                    trending=trending,
                 ),
             )
 
@@ -143,7 +170,7 @@ def main():
                         dict(
                             id=a["author_id"],
                         ),
-                        dict(name=a["name"]),
+                        dict(name=a["name"], normalized=normalize_title(a["name"])),
                     )
 
                 series_author = upsert(
@@ -198,7 +225,10 @@ def main():
                     dict(
                         id=p["publisher_id"],
                     ),
-                    dict(name=p["publisher_name"]),
+                    dict(
+                        name=p["publisher_name"],
+                        normalized=normalize_title(p["publisher_name"]),
+                    ),
                 )
                 publisher_type = upsert(mu_models.PublisherType, dict(name=p["type"]))
                 series_publisher = upsert(
@@ -238,7 +268,11 @@ def main():
             )
 
             for t in r["associated"] + [r]:
-                title = upsert(mu_models.Title, dict(name=t["title"], series=series))
+                title = upsert(
+                    mu_models.Title,
+                    dict(name=t["title"], series=series),
+                    dict(normalized=normalize_title(t["title"])),
+                )
 
         print(f"Phase 1 - done in {time.time()-start:.1f}s")
         start = time.time()
@@ -259,11 +293,11 @@ def main():
                     )
                     continue
 
-                    cat_rec = upsert(
-                        mu_models.CategoryRecommendation,
-                        dict(base_series=series, recommendation=recommendation),
-                        dict(weight=cr["weight"]),
-                    )
+                cat_rec = upsert(
+                    mu_models.CategoryRecommendation,
+                    dict(base_series=series, recommendation=recommendation),
+                    dict(weight=cr["weight"]),
+                )
 
             for rec in r["recommendations"]:
                 try:
@@ -274,9 +308,9 @@ def main():
                     )
                     continue
 
-                cat_rec = upsert(
-                    mu_models.CategoryRecommendation,
-                    dict(base_series=series, recommendation=recommendation),
+                user_rec = upsert(
+                    mu_models.Recommendation,
+                    dict(series_1=series, series_2=recommendation),
                     dict(weight=rec["weight"]),
                 )
 
@@ -323,8 +357,26 @@ def main():
                 )
 
     print(f"[{time.time()-start:.0f}s] Phase 2 - done in {time.time()-start:.1f}s")
+    start = time.time()
+
+    print("Phase 3 - building indexes...", end="\r")
+    build_dir = paths.INDEX_BUILD_DIR
+    Catalog.build().save(build_dir / Catalog.file.name)
+    PrefixIndex.build().save(build_dir / PrefixIndex.file.name)
+    matrix = CategoryMatrix.load()
+    RecommendationGraph.build(matrix).save(build_dir / RecommendationGraph.file.name)
+    RelationGraph.build().save(build_dir / RelationGraph.file.name)
+    franchises = FranchiseIndex.build()
+    franchises.save(build_dir / FranchiseIndex.file.name)
+    franchises.store()
+    CategoryVectors.build(matrix).save(build_dir / CategoryVectors.file.name)
+    print(f"Phase 3 - done in {time.time()-start:.1f}s")
 
 
 import cProfile
 
 cProfile.run("main()", "create.profile")
+
+# swap the new db in and let running servers know the catalog changed
+db.disconnect()
+publish_db(paths.DB_BUILD_FILE, published_db_file, paths.INDEX_BUILD_DIR)
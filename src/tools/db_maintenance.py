@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import sqlite3
+
+from config import paths
+from utils.db_maintenance import (
+    QueryShapes,
+    advise,
+    create_indexes,
+    db_stats,
+    load_auto_indexes,
+    optimize,
+)
+
+###
+
+"""
+Inspect and tune the app db.
+    stats       size, free pages and the biggest tables / indexes
+    advise      EXPLAIN the queries the server recorded (needs db_maintenance_hours > 0 in settings.toml)
+                and suggest indexes for the ones that scan whole tables, --apply to create them
+    optimize    refresh planner statistics, and vacuum if too much of the file is free pages
+Indexes created with --apply are saved and recreated by every import.
+"""
+
+###
+
+parser = argparse.ArgumentParser()
+parser.add_argument("command", choices=["stats", "advise", "optimize"])
+parser.add_argument("--file", type=Path, default=paths.DB_FILE)
+parser.add_argument("--apply", action="store_true", help="create the suggested indexes")
+parser.add_argument(
+    "--min-count",
+    type=int,
+    default=10,
+    help="ignore queries the server ran fewer times than this",
+)
+parser.add_argument(
+    "--vacuum-ratio",
+    type=float,
+    default=0.2,
+    help="vacuum when more than this fraction of the db is free pages",
+)
+args = parser.parse_args()
+
+
+def print_stats(stats: dict) -> None:
+    print(
+        f"{stats['size_bytes'] / 1024**2:.1f}MB, {stats['free_bytes'] / 1024**2:.1f}MB free ({stats['free_ratio']:.0%})"
+    )
+    print(f"Analyzed: {stats['analyzed']}")
+    for name, size in (stats["objects"] or dict()).items():
+        print(f"    {size / 1024**2:>8.1f}MB  {name}")
+
+
+conn = sqlite3.connect(args.file, isolation_level=None)
+
+if args.command == "stats":
+    print_stats(db_stats(conn))
+    saved = load_auto_indexes()
+    if saved:
+        print(f"Saved indexes: {', '.join(saved)}")
+
+elif args.command == "advise":
+    shapes = QueryShapes.load()
+    print(f"Explaining {len(shapes)} query shapes...")
+
+    suggestions = advise(conn, shapes, args.min_count)
+    for s in suggestions:
+        print(f"\n{s.sql}")
+        print(f"    used by {s.count} queries like: {s.shape[:200]}")
+        print(f"    before: {' / '.join(s.plan_before)}")
+        print(f"    after:  {' / '.join(s.plan_after)}")
+
+    if not suggestions:
+        print("No missing indexes found")
+    elif args.apply:
+        create_indexes(conn, suggestions)
+        print(f"\nCreated {len(suggestions)} indexes")
+    else:
+        print("\nRerun with --apply to create them")
+
+elif args.command == "optimize":
+    print_stats(optimize(conn, args.vacuum_ratio))
+
+conn.close()
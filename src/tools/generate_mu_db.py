@@ -0,0 +1,345 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import time
+from functools import cache
+
+import numpy as np
+from config import paths
+from utils.raw_db import FORMATS, RawDb
+
+###
+
+"""
+Generate a fake raw_mu.sqlite in the same shape as scrape_mu_series.py writes, for benchmarking create_mu_db.py
+and the api without scraping mangaupdates.
+Genres, categories, authors, recommendations etc are drawn from zipf distributions, so a handful are very common
+and most are rare, like the real data.
+"""
+
+###
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--series", type=int, default=100_000)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--out", type=Path, default=paths.DATA_DIR / "raw_mu.sqlite")
+parser.add_argument(
+    "--image-url",
+    default="http://127.0.0.1:9998/covers/",
+    help="covers point here, see benchmarks/load_test.py --serve-covers",
+)
+parser.add_argument("--format", choices=FORMATS, default="json")
+parser.add_argument("--force", action="store_true", help="overwrite [out]")
+args = parser.parse_args()
+
+if args.out.exists():
+    if not args.force:
+        print(f"[{args.out}] already exists, pass --force to overwrite it")
+        sys.exit(1)
+    args.out.unlink()
+
+rng = np.random.default_rng(args.seed)
+
+###
+
+GENRES = [
+    "Action",
+    "Adult",
+    "Adventure",
+    "Comedy",
+    "Doujinshi",
+    "Drama",
+    "Ecchi",
+    "Fantasy",
+    "Gender Bender",
+    "Harem",
+    "Hentai",
+    "Historical",
+    "Horror",
+    "Josei",
+    "Lolicon",
+    "Martial Arts",
+    "Mature",
+    "Mecha",
+    "Mystery",
+    "Psychological",
+    "Romance",
+    "School Life",
+    "Sci-fi",
+    "Seinen",
+    "Shotacon",
+    "Shoujo",
+    "Shoujo Ai",
+    "Shounen",
+    "Shounen Ai",
+    "Slice of Life",
+    "Smut",
+    "Sports",
+    "Supernatural",
+    "Tragedy",
+    "Yaoi",
+    "Yuri",
+]
+TYPES = ["Manga", "Manhwa", "Manhua", "Doujinshi", "Novel", "OEL", "Artbook"]
+TYPE_WEIGHTS = [0.55, 0.2, 0.1, 0.08, 0.04, 0.02, 0.01]
+RELATION_TYPES = [
+    "Sequel",
+    "Prequel",
+    "Side Story",
+    "Spin-Off",
+    "Adapted From",
+    "Alternate Story",
+    "Main Story",
+]
+AUTHOR_TYPES = ["Author", "Artist"]
+PUBLISHER_TYPES = ["Original", "English"]
+STATUSES = ["ongoing", "complete", "hiatus"]
+
+SYLLABLES = [
+    "ka",
+    "ki",
+    "ku",
+    "ke",
+    "ko",
+    "sa",
+    "shi",
+    "su",
+    "se",
+    "so",
+    "ta",
+    "chi",
+    "tsu",
+    "te",
+    "to",
+    "na",
+    "ni",
+    "nu",
+    "ne",
+    "no",
+    "ha",
+    "hi",
+    "fu",
+    "he",
+    "ho",
+    "ma",
+    "mi",
+    "mu",
+    "me",
+    "mo",
+    "ya",
+    "yu",
+    "yo",
+    "ra",
+    "ri",
+    "ru",
+    "re",
+    "ro",
+    "wa",
+    "n",
+    "ga",
+    "gi",
+    "da",
+    "de",
+    "bo",
+]
+
+
+@cache
+def zipf_cdf(n: int, s: float) -> np.ndarray:
+    w = 1 / np.arange(1, n + 1) ** s
+    return np.cumsum(w / w.sum())
+
+
+def zipf_draw(n: int, size: int, s: float = 1.1) -> np.ndarray:
+    """
+    [size] indexes into a population of [n], where index i is drawn with probability ~ 1 / (i+1)^s.
+    """
+
+    idx = np.searchsorted(zipf_cdf(n, s), rng.random(size))
+    return np.minimum(idx, n - 1)
+
+
+def zipf_sample(n: int, k: int, s: float = 1.1) -> np.ndarray:
+    """
+    [k] distinct zipf-distributed indexes into a population of [n].
+    """
+
+    k = min(k, n)
+    # over-draw then dedupe, much cheaper than rng.choice(replace=False) on big populations
+    draw = zipf_draw(n, k * 3, s)
+    _, first = np.unique(draw, return_index=True)
+    return draw[np.sort(first)][:k]
+
+
+def make_word() -> str:
+    return "".join(rng.choice(SYLLABLES, size=rng.integers(2, 5)))
+
+
+WORDS = np.array([make_word() for _ in range(20_000)])
+
+
+def make_title() -> str:
+    words = WORDS[zipf_draw(len(WORDS), rng.integers(1, 6), 1.0)]
+    return " ".join(words).title()
+
+
+CATEGORIES = [f"{make_word().title()} {make_word().title()}" for _ in range(6000)]
+AUTHORS = [
+    (i + 1, f"{make_word().title()} {make_word().title()}")
+    for i in range(max(1000, args.series // 3))
+]
+PUBLISHERS = [(i + 1, f"{make_word().title()} Publishing") for i in range(2000)]
+
+n = args.series
+# position in the popularity ranking, series_id 1 isn't necessarily the most popular
+popularity_rank = rng.permutation(n)
+by_popularity = np.argsort(popularity_rank)
+series_ids = np.arange(1, n + 1)
+titles = [make_title() for _ in range(n)]
+
+
+def rank_positions() -> dict:
+    positions = rng.integers(1, n + 1, size=5)
+    return dict(
+        zip(["week", "month", "three_months", "six_months", "year"], positions.tolist())
+    )
+
+
+def make_series(idx: int) -> dict:
+    series_id = int(series_ids[idx])
+    pop = 1 / (popularity_rank[idx] + 1)
+    rating_votes = int(rng.poisson(2000 * pop) + rng.integers(0, 5))
+    year = int(rng.integers(1960, 2025))
+    ts = int(time.time() - rng.integers(0, 10 * 365 * 24 * 60 * 60))
+
+    def link(target: int) -> tuple[int, str]:
+        return int(series_ids[target]), titles[target]
+
+    # mostly recommend popular series
+    recommended = by_popularity[zipf_sample(n, int(rng.integers(0, 12)), 0.8)]
+    category_recommended = by_popularity[zipf_sample(n, int(rng.integers(0, 6)), 0.8)]
+    related = rng.choice(n, size=rng.choice([0, 0, 0, 1, 2]), replace=False)
+
+    return dict(
+        series_id=series_id,
+        title=titles[idx],
+        url=f"https://www.mangaupdates.com/series/{series_id}",
+        associated=[dict(title=make_title()) for _ in range(rng.integers(0, 5))],
+        description=" ".join(WORDS[zipf_draw(len(WORDS), 40, 1.0)]),
+        image=dict(
+            url=dict(
+                original=f"{args.image_url}{series_id}.jpg",
+                thumb=f"{args.image_url}thumb/{series_id}.jpg",
+            ),
+            height=350,
+            width=250,
+        ),
+        type=TYPES[rng.choice(len(TYPES), p=TYPE_WEIGHTS)],
+        year=str(year) if rng.random() > 0.05 else "",
+        bayesian_rating=round(float(np.clip(rng.normal(7, 1), 1, 10)), 2),
+        rating_votes=rating_votes,
+        genres=[
+            dict(genre=GENRES[i])
+            for i in zipf_sample(len(GENRES), int(rng.integers(1, 7)), 0.9)
+        ],
+        categories=[
+            dict(
+                series_id=series_id,
+                category=CATEGORIES[i],
+                votes=(votes := int(rng.integers(1, 30))),
+                votes_plus=votes,
+                votes_minus=0,
+                added_by=1,
+            )
+            for i in zipf_sample(len(CATEGORIES), int(rng.integers(0, 40)))
+        ],
+        latest_chapter=int(rng.integers(1, 300)),
+        forum_id=series_id,
+        status=str(rng.choice(STATUSES)),
+        licensed=bool(rng.random() < 0.2),
+        completed=bool(rng.random() < 0.4),
+        anime=dict(start=None, end=None),
+        related_series=[
+            dict(
+                relation_id=int(rng.integers(1, 2**31)),
+                relation_type=str(rng.choice(RELATION_TYPES)),
+                related_series_id=link(t)[0],
+                related_series_name=link(t)[1],
+                triggered_by_relation_id=0,
+            )
+            for t in related
+            if t != idx
+        ],
+        authors=[
+            dict(name=AUTHORS[i][1], author_id=AUTHORS[i][0], type=AUTHOR_TYPES[j % 2])
+            for j, i in enumerate(
+                zipf_sample(len(AUTHORS), int(rng.integers(1, 3)), 0.7)
+            )
+        ],
+        publishers=[
+            dict(
+                publisher_name=PUBLISHERS[i][1],
+                publisher_id=PUBLISHERS[i][0],
+                type=PUBLISHER_TYPES[j % 2],
+                notes="",
+            )
+            for j, i in enumerate(zipf_sample(len(PUBLISHERS), int(rng.integers(0, 3))))
+        ],
+        publications=[],
+        recommendations=[
+            dict(
+                series_name=link(t)[1],
+                series_id=link(t)[0],
+                weight=int(rng.integers(1, 10)),
+            )
+            for t in recommended
+            if t != idx
+        ],
+        category_recommendations=[
+            dict(
+                series_name=link(t)[1],
+                series_id=link(t)[0],
+                weight=int(rng.integers(1, 10)),
+            )
+            for t in category_recommended
+            if t != idx
+        ],
+        rank=dict(
+            position=rank_positions(),
+            old_position=rank_positions(),
+            lists=dict(
+                reading=int(rng.poisson(5000 * pop)),
+                wish=int(rng.poisson(3000 * pop)),
+                unfinished=int(rng.poisson(500 * pop)),
+                custom=int(rng.poisson(200 * pop)),
+            ),
+        ),
+        last_updated=dict(
+            timestamp=ts,
+            as_rfc3339=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)),
+            as_string=time.strftime("%B %d, %Y %I:%M%p UTC", time.gmtime(ts)),
+        ),
+    )
+
+
+###
+
+db = RawDb(args.out)
+
+start = time.time()
+batch_size = 5000
+for offset in range(0, n, batch_size):
+    with db.db:
+        for idx in range(offset, min(offset + batch_size, n)):
+            r = make_series(idx)
+            db.put(r["series_id"], r, time.time())
+    print(f"[{time.time()-start:.0f}s] {offset + batch_size} / {n}...", end="\r")
+
+if args.format != "json":
+    print(f"Converting to {args.format}...")
+    db.convert(args.format)
+
+print(f"Wrote {n} series to [{args.out}] in {time.time()-start:.1f}s")
@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import time
+
+from config import paths
+from utils.raw_db import FORMATS, RawDb
+
+###
+
+"""
+Convert raw_mu.sqlite between plain json and zstd compressed rows.
+Safe to rerun, eg to retrain the zstd dictionary after a big scrape.
+"""
+
+###
+
+parser = argparse.ArgumentParser()
+parser.add_argument("format", choices=FORMATS)
+parser.add_argument("--file", type=Path, default=paths.DATA_DIR / "raw_mu.sqlite")
+parser.add_argument(
+    "--sample-size",
+    type=int,
+    default=5000,
+    help="number of rows to train the zstd dictionary on",
+)
+args = parser.parse_args()
+
+size_before = args.file.stat().st_size
+start = time.time()
+
+db = RawDb(args.file)
+print(f"Converting {db.count()} series from {db.format} to {args.format}...")
+db.convert(args.format, args.sample_size)
+db.close()
+
+size_after = args.file.stat().st_size
+print(
+    f"Done in {time.time()-start:.1f}s, {size_before / 1024**2:.1f}MB -> {size_after / 1024**2:.1f}MB"
+)
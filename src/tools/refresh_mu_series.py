@@ -0,0 +1,112 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import logging
+import time
+
+import numpy as np
+from classes.settings import Settings
+from config import paths
+from utils.logging import configure_logging
+from utils.mu_api import fetch_series
+from utils.ranking import refresh_priority
+from utils.raw_db import RawDb
+
+###
+
+"""
+Re-fetch series that are already in raw_mu.sqlite, most valuable first, within a fixed request budget.
+Value is decided by utils.ranking.refresh_priority (fetch age, mu update time, completed, popularity).
+Run create_mu_db.py afterwards to publish the changes.
+"""
+
+###
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--budget", type=int, default=600, help="max api requests per hour")
+parser.add_argument(
+    "--min-age",
+    type=float,
+    default=24,
+    help="never re-fetch a series fetched less than this many hours ago",
+)
+parser.add_argument(
+    "--loop", action="store_true", help="keep refreshing, one batch per hour"
+)
+args = parser.parse_args()
+if args.budget < 1:
+    parser.error("--budget must be at least 1")
+
+configure_logging("mu-refresh-series", Settings.load())
+
+db = RawDb(paths.DATA_DIR / "raw_mu.sqlite")
+
+###
+
+
+def plan(now: float, limit: int) -> np.ndarray:
+    """
+    Ids of the [limit] series most in need of a refresh.
+    """
+
+    stats = db.fetch_stats()
+    priority = refresh_priority(
+        now,
+        stats["last_fetch"],
+        stats["last_updated"],
+        stats["completed"],
+        stats["popularity"],
+    )
+
+    eligible = np.flatnonzero(now - stats["last_fetch"] >= args.min_age * 3600)
+    if len(eligible) > limit:
+        top = np.argpartition(-priority[eligible], limit - 1)[:limit]
+        eligible = eligible[top]
+
+    order = np.argsort(-priority[eligible], kind="stable")
+    return stats["ids"][eligible[order]]
+
+
+def refresh_batch() -> None:
+    start = time.time()
+    ids = plan(start, args.budget)
+    logging.info(f"Refreshing {len(ids)} series")
+
+    # spread the budget over the hour instead of bursting
+    spacing = 3600 / args.budget
+    errors = 0
+    for idx, id in enumerate(ids):
+        print(f"{idx:06d} / {len(ids)}", end="\r")
+
+        next_call = start + idx * spacing
+        if time.time() < next_call:
+            time.sleep(next_call - time.time())
+
+        try:
+            db.put(int(id), fetch_series(int(id)), time.time())
+        except Exception as e:
+            errors += 1
+            logging.error(f"Error refreshing [{id=}]")
+            logging.exception(e)
+
+        if idx % 100 == 0:
+            db.commit()
+
+    db.commit()
+    print(f"Refreshed {len(ids) - errors} series ({errors} errors)")
+    logging.info(f"Refreshed {len(ids) - errors} series ({errors} errors)")
+
+    # wait out the rest of the hour so the budget holds across batches
+    if args.loop:
+        time.sleep(max(0, start + 3600 - time.time()))
+
+
+while True:
+    refresh_batch()
+    if not args.loop:
+        break
+
+db.close()
@@ -0,0 +1,66 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import logging
+import time
+from concurrent.futures import wait
+
+from classes.library import derivatives, library
+from classes.settings import Settings
+from utils.logging import configure_logging
+
+###
+
+"""
+Sync the library db with the series folders listed in settings.toml.
+"""
+
+###
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--thumbnails",
+    action="store_true",
+    help="pre-generate page thumbnails for new / changed chapters",
+)
+args = parser.parse_args()
+
+###
+
+settings = Settings.load()
+configure_logging("scan_library", settings)
+
+derivatives.max_bytes = settings.derivative_cache_mb * 1024**2
+derivatives.workers = settings.derivative_workers
+
+if not settings.scan_enabled:
+    print("Not scanning, some series dirs are missing")
+    sys.exit(1)
+
+start = time.time()
+print(f"Scanning {len(settings.series_dirs)} dirs...")
+logging.info(f"Scanning {settings.series_dirs}")
+
+changed = library.scan(settings.series_dirs)
+
+print(f"Found {len(changed)} new / changed chapters in {time.time()-start:.1f}s")
+
+if args.thumbnails:
+    start = time.time()
+    for i, id in enumerate(changed):
+        print(
+            f"[{time.time()-start:.0f}s] Thumbnails - {i:05d} / {len(changed)}...",
+            end="\r",
+        )
+
+        chapter = library.chapter(id)
+        try:
+            wait(derivatives.pregenerate(chapter, library.pages(chapter) or []))
+        except Exception as e:
+            logging.error(f"Failed to generate thumbnails for [{chapter.path}]")
+            logging.exception(e)
+
+    print(f"Thumbnails - done in {time.time()-start:.1f}s")
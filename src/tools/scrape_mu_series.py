@@ -7,15 +7,14 @@ sys.path.append(str(Path(__file__).parent.parent))
 import traceback
 import json
 import logging
-import sqlite3
 import sys
 import time
 
-import requests
-import utils
+from classes.settings import Settings
 from config import paths
-from urlpath import URL
 from utils.logging import configure_logging
+from utils.mu_api import fetch_series
+from utils.raw_db import RawDb
 
 ###
 
@@ -25,9 +24,7 @@ Fetch series data from the mu api. Basically stores the response as a json, no o
 
 ###
 
-configure_logging(
-    name_fn=lambda d: f"mu-fetch-series_{int(time.time())}_{d['pid']}.log"
-)
+configure_logging("mu-fetch-series", Settings.load())
 
 ###
 
@@ -37,42 +34,11 @@ with open(search_db_file) as file:
 
 ###
 
-db_file = paths.DATA_DIR / "raw_mu.sqlite"
-db = sqlite3.connect(db_file)
-
-db.execute(
-    """
-    CREATE TABLE IF NOT EXISTS series (
-        id              INTEGER         PRIMARY KEY,
-        last_fetch      REAL            NOT NULL,
-        data            TEXT            NOT NULL
-    )
-    """
-)
+db = RawDb(paths.DATA_DIR / "raw_mu.sqlite")
 
 
 def insert(id: int, data: dict) -> None:
-    db.execute(
-        "INSERT OR REPLACE INTO series VALUES (?, ?, ?)",
-        (id, time.time(), json.dumps(data)),
-    )
-
-
-###
-
-MU_API = URL("https://api.mangaupdates.com/v1")
-
-
-@utils.limit(calls=1, period=1, scope="mu")
-def search(id: int):
-    logging.debug(f"fetching series [{id}]")
-
-    ep = MU_API / "series" / str(id)
-    resp = requests.get(str(ep))
-    data = resp.json()
-    assert resp.status_code == 200
-
-    return data
+    db.put(id, data, time.time())
 
 
 ###
@@ -98,9 +64,9 @@ while len(unseen) > 0:
     idx += 1
 
     try:
-        data = db.execute(f"SELECT data FROM series WHERE id={id}").fetchone()
+        data = db.db.execute("SELECT data FROM series WHERE id = ?", (id,)).fetchone()
         if data is None:
-            data = search(id)
+            data = fetch_series(id)
             insert(id, data)
             new_ids = d1 = set(
                 x["series_id"]
@@ -108,7 +74,7 @@ while len(unseen) > 0:
                 for x in data[grp]
             )
         else:
-            new_ids = set(int(x) for x in id_patt.findall(data[0]))
+            new_ids = set(int(x) for x in id_patt.findall(db.decode_text(data[0])))
             new_ids = set(x for x in new_ids if x > 100000)
 
         unseen.update(new_ids.difference(seen))
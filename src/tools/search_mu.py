@@ -12,6 +12,7 @@ import requests
 import utils
 from config import paths
 from urlpath import URL
+from utils.text import normalize_title
 
 debug_file = paths.LOG_DIR / "mu_search.log"
 log = logging.basicConfig(
@@ -32,14 +33,18 @@ MU_API = URL("https://api.mangaupdates.com/v1")
 
 
 @utils.limit(calls=1, period=1, scope="mu")
-def _search(name: str):
+def _search(name: str, key: str):
+    """
+    Search mangaupdates for [name] as-is, and cache the result under [key].
+    """
+
     ep = MU_API / "series" / "search"
     resp = requests.post(str(ep), json=dict(search=name))
     data = resp.json()
     assert resp.status_code == 200
 
     logging.debug(f"fetching [{name}] from [{ep}]")
-    db[name] = dict(
+    db[key] = dict(
         time=time.time(), ids=[x["record"]["series_id"] for x in data["results"]]
     )
     if random.random() < 0.05:
@@ -51,14 +56,19 @@ def _search(name: str):
 
 
 def search(name: str):
-    name = name.lower()
+    # entries cached before normalization was added are keyed by name.lower()
+    legacy_key = name.lower()
+    # normalized for the cache key only, mangaupdates gets the original name
+    key = normalize_title(name)
     logging.debug(f"Searching for [{name}]")
 
-    if name in db:
-        return db[name]
+    if key in db:
+        return db[key]
+    elif legacy_key in db:
+        return db[legacy_key]
     else:
         logging.info(f"cache miss for [{name}]")
-        return _search(name)
+        return _search(name, key)
 
 
 start = time.time()
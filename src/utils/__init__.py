@@ -1 +1,7 @@
-from .misc import limit
\ No newline at end of file
+from .misc import limit
+from .data_version import (
+    bump_data_version,
+    current_data_version,
+    publish_db,
+    read_data_version,
+)
@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable, TypeVar
+
+from .metrics import COALESCED_CALLS
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Lets concurrent calls with the same key share one execution. The first caller runs the function,
+    the others block until it's done and get the same result (or exception).
+    Nothing is kept once the call finishes, this only de-duplicates work that overlaps in time.
+    """
+
+    def __init__(self, name: str):
+        # metrics label
+        self.name = name
+
+        self._inflight: dict[Hashable, Future] = dict()
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            COALESCED_CALLS.inc(flight=self.name, result="shared")
+            return future.result()
+
+        COALESCED_CALLS.inc(flight=self.name, result="leader")
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key: Hashable) -> None:
+        with self._lock:
+            del self._inflight[key]
+
+
+def request_key(**params) -> tuple:
+    """
+    Hashable key for a set of query params. Lists are treated as sets, and missing / empty values are dropped,
+    so eg ?genres=a&genres=b and ?genres=b&genres=a coalesce.
+    """
+
+    key = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, (list, tuple)):
+            value = tuple(sorted(set(value)))
+        if value is None or value == ():
+            continue
+        key.append((name, value))
+    return tuple(key)
@@ -0,0 +1,85 @@
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from config import paths
+
+from .db_maintenance import apply_auto_indexes
+
+# (time checked, version) for current_data_version
+_cached: tuple[float, float | None] = (0.0, None)
+
+
+def read_data_version() -> float | None:
+    """
+    Version stamp of the imported catalog, or None if nothing has been imported yet.
+    """
+
+    try:
+        return float(paths.DATA_VERSION_FILE.read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def current_data_version(max_age: float = 1.0) -> float | None:
+    """
+    read_data_version, but only hits the disk once every [max_age] seconds.
+    """
+
+    global _cached
+
+    now = time.time()
+    if now - _cached[0] > max_age:
+        _cached = (now, read_data_version())
+    return _cached[1]
+
+
+def bump_data_version() -> float:
+    """
+    Signal readers (eg the server's in-memory catalog) that the db contents changed.
+    """
+
+    version = time.time()
+    tmp_file = paths.DATA_VERSION_FILE.with_suffix(".tmp")
+    tmp_file.write_text(str(version))
+    tmp_file.replace(paths.DATA_VERSION_FILE)
+    return version
+
+
+def publish_db(
+    build_file: Path,
+    target: Path,
+    index_build_dir: Path = None,
+    index_dir: Path = paths.INDEX_DIR,
+) -> float:
+    """
+    Optimize a freshly built db (recreating the indexes added by tools/db_maintenance.py, and collecting
+    planner statistics), then atomically swap it in for [target] and bump the data version.
+    Open connections keep reading the old file until they reconnect, so readers never see a partial import.
+    The in-memory indexes built alongside it ([index_build_dir]) are moved into [index_dir] right before the db,
+    so nothing built from the new db is visible until the import is published.
+    """
+
+    start = time.time()
+    conn = sqlite3.connect(build_file, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = DELETE")
+        apply_auto_indexes(conn)
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    logging.info(f"Optimized [{build_file}] in {time.time()-start:.1f}s")
+
+    if index_build_dir is not None:
+        for f in index_build_dir.iterdir():
+            # mapped snapshots keep reading the replaced file, like open connections do with the db
+            os.replace(f, index_dir / f.name)
+        index_build_dir.rmdir()
+
+    os.replace(build_file, target)
+    version = bump_data_version()
+    logging.info(f"Published [{target}] as version [{version}]")
+    return version
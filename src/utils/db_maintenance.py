@@ -0,0 +1,336 @@
+"""
+Upkeep for the app db: which queries the server runs, whether sqlite has indexes for them,
+planner statistics and how much of the file is wasted space.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from config import paths
+
+from .metrics import DB_FREE_RATIO, DB_SIZE
+
+# indexes created by the advisor, re-applied to every fresh import (see utils.publish_db)
+AUTO_INDEX_FILE = paths.DATA_DIR / "auto_indexes.json"
+# query shapes seen by the server, one file per worker, read by the cli
+QUERY_SHAPES_DIR = paths.DATA_DIR / "query_shapes"
+
+# quoted identifiers are kept, numeric / string literals become placeholders
+TOKEN_PATT = re.compile(r"(\"[^\"]*\")|('(?:[^']|'')*')|(\b\d+(?:\.\d+)?\b)")
+IN_LIST_PATT = re.compile(r"IN \((?:\?\s*,\s*)*\?\)")
+ALIAS_PATT = re.compile(r'(?:FROM|JOIN|,)\s+"(\w+)"\s+"([\w-]+)"')
+SCAN_PATT = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS (\S+))?$")
+
+EQUALITY_OPS = ["=", "IN", "IS"]
+RANGE_OPS = ["<", "<=", ">", ">=", "BETWEEN", "LIKE"]
+
+
+def normalize_sql(sql: str) -> str:
+    def replace(m: re.Match) -> str:
+        return m.group(1) or "?"
+
+    sql = TOKEN_PATT.sub(replace, sql)
+    sql = IN_LIST_PATT.sub("IN (?)", sql)
+    return " ".join(sql.split())
+
+
+class QueryShapes:
+    """
+    sql hook (see classes.models.sql_hooks) that groups statements by shape, ie ignoring literal values,
+    and keeps a runnable example of each for EXPLAIN.
+    """
+
+    max_shapes = 1000
+
+    def __init__(self):
+        # shape -> dict(count, seconds, sql, arguments)
+        self.shapes: dict[str, dict] = dict()
+        self._lock = threading.Lock()
+
+    def __call__(self, sql: str, arguments: object, elapsed: float) -> None:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            return
+
+        shape = normalize_sql(sql)
+        with self._lock:
+            entry = self.shapes.get(shape)
+            if entry is None:
+                if len(self.shapes) >= self.max_shapes:
+                    return
+                args = arguments if isinstance(arguments, (tuple, list)) else None
+                entry = self.shapes[shape] = dict(
+                    count=0, seconds=0.0, sql=sql, arguments=args
+                )
+            entry["count"] += 1
+            entry["seconds"] += elapsed
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {shape: dict(entry) for shape, entry in self.shapes.items()}
+
+    def save(self) -> None:
+        QUERY_SHAPES_DIR.mkdir(parents=True, exist_ok=True)
+        file = QUERY_SHAPES_DIR / f"{os.getpid()}.json"
+
+        tmp_file = file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(self.snapshot(), default=str))
+        tmp_file.replace(file)
+
+    @staticmethod
+    def load() -> dict[str, dict]:
+        """
+        Shapes saved by every worker, merged.
+        """
+
+        shapes = dict()
+        for file in QUERY_SHAPES_DIR.glob("*.json"):
+            for shape, entry in json.loads(file.read_text()).items():
+                merged = shapes.setdefault(shape, dict(entry, count=0, seconds=0.0))
+                merged["count"] += entry["count"]
+                merged["seconds"] += entry["seconds"]
+        return shapes
+
+
+@dataclass
+class IndexSuggestion:
+    table: str
+    columns: list[str]
+    # shape that would use it, and how often the server ran it
+    shape: str
+    count: int
+    plan_before: list[str]
+    plan_after: list[str] | None = None
+
+    @property
+    def name(self) -> str:
+        return f"idx_auto_{self.table.lower()}__{'_'.join(self.columns)}"
+
+    @property
+    def sql(self) -> str:
+        columns = ", ".join(f'"{c}"' for c in self.columns)
+        return f'CREATE INDEX IF NOT EXISTS "{self.name}" ON "{self.table}" ({columns})'
+
+    @property
+    def helps(self) -> bool:
+        return self.plan_after is not None and self.plan_after != self.plan_before
+
+
+def explain(conn: sqlite3.Connection, sql: str, arguments=None) -> list[str]:
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, arguments or ()).fetchall()
+    return [r[-1] for r in rows]
+
+
+def _columns_for(sql: str, alias: str) -> list[str]:
+    """
+    Columns of [alias] that the query filters / sorts on, equality filters first so a
+    multi-column index can serve them all.
+    """
+
+    a = re.escape(alias)
+    equality, ranges = [], []
+    for col, op in re.findall(
+        rf'"{a}"\."(\w+)"\s*(<=|>=|=|<|>|IN\b|IS\b|BETWEEN\b|LIKE\b)', sql
+    ):
+        target = equality if op in EQUALITY_OPS else ranges
+        if col not in equality and col not in ranges:
+            target.append(col)
+
+    order_by = sql.upper().rfind("ORDER BY")
+    if order_by >= 0:
+        for col in re.findall(rf'"{a}"\."(\w+)"', sql[order_by:]):
+            if col not in equality and col not in ranges:
+                ranges.append(col)
+
+    # sqlite can only use one range column per index, after the equality ones
+    return equality + ranges[:1]
+
+
+def advise(
+    conn: sqlite3.Connection, shapes: dict[str, dict], min_count: int = 1
+) -> list[IndexSuggestion]:
+    """
+    EXPLAIN each query shape, and for every full table scan propose an index on the columns it filters by.
+    Each proposal is tried in a rolled-back transaction to check it actually changes the plan.
+    """
+
+    suggestions: dict[str, IndexSuggestion] = dict()
+    by_count = sorted(shapes.items(), key=lambda x: -x[1]["count"])
+
+    for shape, entry in by_count:
+        if entry["count"] < min_count:
+            continue
+
+        sql, args = entry["sql"], entry["arguments"]
+        try:
+            plan = explain(conn, sql, args)
+        except sqlite3.Error as e:
+            logging.debug(f"Can't explain [{shape}]: {e}")
+            continue
+
+        tables = {alias: table for table, alias in ALIAS_PATT.findall(sql)}
+        for detail in plan:
+            m = SCAN_PATT.match(detail)
+            if m is None:
+                continue
+
+            alias = m.group(2) or m.group(1)
+            table = tables.get(alias)
+            columns = _columns_for(sql, alias) if table else []
+            if not columns:
+                continue
+
+            suggestion = IndexSuggestion(table, columns, shape, entry["count"], plan)
+            if suggestion.name in suggestions:
+                suggestions[suggestion.name].count += entry["count"]
+                continue
+
+            conn.execute("BEGIN")
+            try:
+                conn.execute(suggestion.sql)
+                suggestion.plan_after = explain(conn, sql, args)
+            except sqlite3.Error as e:
+                logging.debug(f"Failed to try [{suggestion.sql}]: {e}")
+            finally:
+                conn.execute("ROLLBACK")
+
+            if suggestion.helps:
+                suggestions[suggestion.name] = suggestion
+
+    return sorted(suggestions.values(), key=lambda s: -s.count)
+
+
+def create_indexes(conn: sqlite3.Connection, suggestions: list[IndexSuggestion]):
+    """
+    Create the suggested indexes and remember them, so they're rebuilt on the next import.
+    """
+
+    saved = load_auto_indexes()
+    for s in suggestions:
+        logging.info(f"Creating index [{s.sql}]")
+        conn.execute(s.sql)
+        saved[s.name] = s.sql
+    conn.execute("ANALYZE")
+
+    tmp_file = AUTO_INDEX_FILE.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps(saved, indent=2))
+    tmp_file.replace(AUTO_INDEX_FILE)
+
+
+def load_auto_indexes() -> dict[str, str]:
+    if not AUTO_INDEX_FILE.exists():
+        return dict()
+    return json.loads(AUTO_INDEX_FILE.read_text())
+
+
+def apply_auto_indexes(conn: sqlite3.Connection) -> None:
+    for name, sql in load_auto_indexes().items():
+        try:
+            conn.execute(sql)
+        except sqlite3.Error as e:
+            # eg a column that was dropped from the models
+            logging.warning(f"Skipping saved index [{name}]: {e}")
+
+
+def db_stats(conn: sqlite3.Connection) -> dict:
+    """
+    File size, wasted (free) pages and the biggest tables / indexes.
+    """
+
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    stats = dict(
+        size_bytes=page_size * page_count,
+        free_bytes=page_size * freelist_count,
+        free_ratio=freelist_count / page_count if page_count else 0,
+        analyzed=bool(
+            conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone()
+        ),
+        objects=None,
+    )
+
+    try:
+        # not every sqlite build has the dbstat table
+        stats["objects"] = dict(
+            conn.execute(
+                "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC LIMIT 20"
+            ).fetchall()
+        )
+    except sqlite3.Error:
+        pass
+
+    return stats
+
+
+def optimize(conn: sqlite3.Connection, vacuum_ratio: float = 0.2) -> dict:
+    """
+    Refresh planner statistics, and vacuum if more than [vacuum_ratio] of the file is free pages.
+    """
+
+    start = time.time()
+    conn.execute("PRAGMA optimize")
+    stats = db_stats(conn)
+    if stats["free_ratio"] > vacuum_ratio:
+        logging.info(f"Vacuuming, {stats['free_ratio']:.0%} of the db is free pages")
+        conn.execute("VACUUM")
+        stats = db_stats(conn)
+
+    logging.info(f"Optimized db in {time.time()-start:.1f}s")
+    return stats
+
+
+class MaintenanceJob:
+    """
+    Background thread in the server that periodically saves the query shapes and reads the db stats.
+    It only reads the live db: anything that writes (advise()'s trial indexes, PRAGMA optimize, vacuuming)
+    is left to tools/db_maintenance.py, which works from the saved shapes.
+    """
+
+    def __init__(self, db_file: Path, shapes: QueryShapes, interval: float):
+        self.db_file = db_file
+        self.shapes = shapes
+        self.interval = interval
+
+        self.last_stats: dict | None = None
+        self.last_shape_count = 0
+
+    def start(self) -> None:
+        threading.Thread(target=self._loop, daemon=True, name="db_maintenance").start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run()
+            except Exception as e:
+                logging.error("Db maintenance failed")
+                logging.exception(e)
+
+    def run(self) -> None:
+        self.last_shape_count = len(self.shapes.snapshot())
+        self.shapes.save()
+
+        conn = sqlite3.connect(f"{self.db_file.as_uri()}?mode=ro", uri=True)
+        try:
+            self.last_stats = db_stats(conn)
+        finally:
+            conn.close()
+
+        DB_SIZE.set(self.last_stats["size_bytes"])
+        DB_FREE_RATIO.set(self.last_stats["free_ratio"])
+        logging.info(
+            f"Saved {self.last_shape_count} query shapes, run tools/db_maintenance.py advise for index suggestions"
+        )
+
+    def report(self) -> dict:
+        return dict(stats=self.last_stats, query_shapes=self.last_shape_count)
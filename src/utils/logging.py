@@ -1,22 +1,129 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import multiprocessing
+import queue
 import time
+from typing import TYPE_CHECKING
 
 from config import paths
 
+if TYPE_CHECKING:
+    from classes.settings import Settings
 
-def configure_logging(name_fn=None):
-    logging.getLogger("urllib3").setLevel(logging.WARNING)
+DEFAULT_LEVELS = dict(root="DEBUG", urllib3="WARNING")
 
-    name_fn = name_fn or (lambda d: f'logs_{int(time.time())}_{d["pid"]}.log')
-    data = dict(pid=multiprocessing.current_process().pid, time=int(time.time()))
-    debug_file = paths.LOG_DIR / name_fn(data)
+TEXT_FORMAT = "%(asctime)s,%(msecs)03d %(levelname)s %(message)s"
 
-    logging.basicConfig(
-        filename=debug_file,
-        filemode="w+",
-        encoding="utf-8",
-        format="%(asctime)s,%(msecs)03d %(levelname)s %(message)s",
-        datefmt=r"%H:%M:%S",
-        level=logging.DEBUG,
+# running listener, so reconfiguring doesn't leave an old writer thread behind
+_listener: logging.handlers.QueueListener | None = None
+
+
+@atexit.register
+def _stop_listener() -> None:
+    """
+    Flush whatever is still queued.
+    """
+
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One json object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = dict(
+            time=record.created,
+            level=record.levelname,
+            logger=record.name,
+            pid=record.process,
+            thread=record.threadName,
+            message=record.getMessage(),
+        )
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def configure_logging(
+    name: str = "server", settings: "Settings" = None, per_process: bool = False
+):
+    """
+    Log to LOG_DIR/[name].log, rotated by size (or time, see Settings.log_rotate_when).
+    Records are put on a queue and written by a background thread, so logging never blocks on file io.
+    Rotation isn't safe across processes, so each process needs its own file: pass a distinct [name], or
+    [per_process] to log to LOG_DIR/[name].[pid].log (eg server workers, which all share a name).
+    Old files are cleaned up by remove_old_logs.
+    """
+
+    global _listener
+
+    levels = {**DEFAULT_LEVELS, **(settings.log_levels if settings else {})}
+    fmt = settings.log_format if settings else "text"
+    max_mb = settings.log_max_mb if settings else 10
+    backups = settings.log_backups if settings else 5
+    rotate_when = settings.log_rotate_when if settings else ""
+    retention_days = settings.log_retention_days if settings else 14
+
+    remove_old_logs(retention_days)
+
+    if per_process:
+        name = f"{name}.{multiprocessing.current_process().pid}"
+    file = paths.LOG_DIR / f"{name}.log"
+    if rotate_when:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            file, when=rotate_when, backupCount=backups, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            file, maxBytes=max_mb * 1024**2, backupCount=backups, encoding="utf-8"
+        )
+
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=r"%H:%M:%S"))
+
+    _stop_listener()
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
     )
+    _listener.start()
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    for logger, level in levels.items():
+        target = root if logger == "root" else logging.getLogger(logger)
+        target.setLevel(level.upper())
+
+    logging.info(
+        f"Logging to [{file}] from pid {multiprocessing.current_process().pid}"
+    )
+
+
+def remove_old_logs(days: int) -> None:
+    """
+    Delete log files (including rotated ones) not written to in [days] days, 0 to keep everything.
+    """
+
+    if days <= 0:
+        return
+
+    cutoff = time.time() - days * 24 * 60 * 60
+    for f in paths.LOG_DIR.glob("*.log*"):
+        try:
+            if f.stat().st_mtime < cutoff:
+                f.unlink()
+        except FileNotFoundError:
+            pass
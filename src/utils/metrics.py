@@ -0,0 +1,198 @@
+"""
+Minimal in-process metrics in the prometheus text format.
+"""
+
+import bisect
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+DEFAULT_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metric:
+    type: str
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.values: dict[tuple, float] = dict()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: list[float] = None):
+        super().__init__(name, help)
+        self.buckets = sorted(buckets or DEFAULT_BUCKETS)
+        # labels -> ([count per bucket] + [count above the last bucket], sum)
+        self.values: dict[tuple, tuple[list[int], float]] = dict()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self.values.get(key, (None, 0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[idx] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], counts):
+                    cumulative += count
+                    labels = _format_labels(key + (("le", bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = dict()
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: list[float] = None) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+@dataclass
+class RequestStats:
+    """
+    Per-request accumulator. Sync routes run in a threadpool that copies the ContextVar, so they see the same object.
+    """
+
+    route: str
+    scope: dict | None = None
+    sql_count: int = 0
+    sql_time: float = 0
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar(
+    "current_request", default=None
+)
+
+
+### metrics shared across the app
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "mu_request_duration_seconds", "Time taken to serve a request, by route"
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "mu_requests_in_flight", "Requests currently being served"
+)
+REQUEST_SQL_COUNT = REGISTRY.histogram(
+    "mu_request_sql_statements",
+    "SQL statements run per request, by route",
+    buckets=[0, 1, 2, 5, 10, 25, 50, 100, 250],
+)
+REQUEST_SQL_TIME = REGISTRY.histogram(
+    "mu_request_sql_seconds", "Time spent in SQL per request, by route"
+)
+SQL_STATEMENTS = REGISTRY.counter(
+    "mu_sql_statements_total", "SQL statements run, including outside of requests"
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "mu_cache_requests_total", "Cache lookups, by cache and result (hit / miss)"
+)
+COALESCED_CALLS = REGISTRY.counter(
+    "mu_coalesced_calls_total",
+    "Calls to coalesced work, by flight and result (leader ran it / shared another call's result)",
+)
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "mu_admission_active", "Requests running, by admission pool"
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "mu_admission_queued", "Requests waiting for a slot, by admission pool"
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "mu_admission_wait_seconds", "Time spent waiting for a slot, by admission pool"
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "mu_admission_rejected_total",
+    "Requests turned away with a 503, by admission pool and reason (queue_full / timeout / displaced)",
+)
+DB_SIZE = REGISTRY.gauge(
+    "mu_db_size_bytes", "Size of the app db, as of the last maintenance run"
+)
+DB_FREE_RATIO = REGISTRY.gauge(
+    "mu_db_free_ratio", "Fraction of the app db that is free (reusable) pages"
+)
+
+
+def record_sql(sql: str, arguments: object, elapsed: float) -> None:
+    SQL_STATEMENTS.inc()
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += elapsed
@@ -0,0 +1,20 @@
+import logging
+
+import requests
+from urlpath import URL
+
+from .misc import limit
+
+MU_API = URL("https://api.mangaupdates.com/v1")
+
+
+@limit(calls=1, period=1, scope="mu")
+def fetch_series(id: int) -> dict:
+    logging.debug(f"fetching series [{id}]")
+
+    ep = MU_API / "series" / str(id)
+    resp = requests.get(str(ep))
+    data = resp.json()
+    assert resp.status_code == 200
+
+    return data
@@ -0,0 +1,184 @@
+"""
+Tools for looking at a live worker: a sampling profiler and a slow query log.
+Neither costs anything until switched on.
+"""
+
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from .data_version import current_data_version
+from .metrics import current_request
+
+
+class SamplingProfiler:
+    """
+    Snapshots the stack of every thread at a fixed interval, without tracing hooks,
+    so the profiled code runs at (nearly) full speed.
+    Results are in the speedscope format (https://www.speedscope.app), one profile per thread.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+
+        self._frames: list[dict] = []
+        self._frame_ids: dict[tuple, int] = dict()
+        self._samples: dict[int, list[list[int]]] = dict()
+        self._weights: dict[int, list[float]] = dict()
+
+    def run(self, seconds: float) -> dict:
+        """
+        Sample for [seconds], blocking the calling thread (which is left out of the profile).
+        """
+
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+
+        start = last = time.perf_counter()
+        while last - start < seconds:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._sample(thread_id, frame, elapsed)
+
+        names.update({t.ident: t.name for t in threading.enumerate()})
+        return self.to_speedscope(names, last - start)
+
+    def _sample(self, thread_id: int, frame, weight: float) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+
+            idx = self._frame_ids.get(key)
+            if idx is None:
+                idx = self._frame_ids[key] = len(self._frames)
+                self._frames.append(dict(name=key[0], file=key[1], line=key[2]))
+
+            stack.append(idx)
+            frame = frame.f_back
+        stack.reverse()
+
+        self._samples.setdefault(thread_id, []).append(stack)
+        self._weights.setdefault(thread_id, []).append(weight)
+
+    def to_speedscope(self, thread_names: dict[int, str], duration: float) -> dict:
+        profiles = []
+        for thread_id, samples in self._samples.items():
+            profiles.append(
+                dict(
+                    type="sampled",
+                    name=thread_names.get(thread_id, str(thread_id)),
+                    unit="seconds",
+                    startValue=0,
+                    endValue=duration,
+                    samples=samples,
+                    weights=self._weights[thread_id],
+                )
+            )
+
+        # busiest thread first, speedscope opens that one
+        profiles.sort(key=lambda p: -sum(p["weights"]))
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"mu_reader_server {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            "exporter": "mu_reader_server",
+            "activeProfileIndex": 0,
+            "shared": dict(frames=self._frames),
+            "profiles": profiles,
+        }
+
+
+class SlowQueryLog:
+    """
+    sql hook (see classes.models.sql_hooks) that records statements slower than [threshold] seconds,
+    along with the request that ran them and the query plan.
+    Plans are computed on a separate read-only connection, off the request thread.
+    Like the pony connections, it's reopened after the importer publishes a new db file.
+    """
+
+    def __init__(self, db_file: Path, threshold: float, history: int = 100):
+        self.db_file = db_file
+        self.threshold = threshold
+
+        self.entries: deque[dict] = deque(maxlen=history)
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="slow_query")
+        self._conn: sqlite3.Connection | None = None
+        self._conn_version: float | None = None
+
+    def __call__(self, sql: str, arguments: object, elapsed: float) -> None:
+        if elapsed < self.threshold:
+            return
+
+        entry = dict(
+            time=time.time(),
+            seconds=elapsed,
+            sql=sql,
+            arguments=self._printable(arguments),
+            route=None,
+            params=None,
+            plan=None,
+        )
+
+        stats = current_request.get()
+        if stats is not None and stats.scope is not None:
+            route = stats.scope.get("route")
+            entry["route"] = getattr(route, "path", stats.scope.get("path"))
+            entry["params"] = {
+                **stats.scope.get("path_params", {}),
+                **dict(parse_qsl(stats.scope.get("query_string", b"").decode())),
+            }
+
+        self.entries.append(entry)
+        self._executor.submit(self._explain, entry, arguments)
+
+    def _explain(self, entry: dict, arguments: object) -> None:
+        try:
+            # only plain selects are safe to replay, executemany() args can't be explained
+            if entry["sql"].lstrip().upper().startswith("SELECT") and not isinstance(
+                arguments, list
+            ):
+                version = current_data_version()
+                if self._conn is not None and self._conn_version != version:
+                    # still pointing at the replaced file, whose indexes / stats may differ
+                    self._conn.close()
+                    self._conn = None
+                if self._conn is None:
+                    uri = f"{self.db_file.as_uri()}?mode=ro"
+                    self._conn = sqlite3.connect(uri, uri=True)
+                    self._conn_version = version
+
+                rows = self._conn.execute(
+                    "EXPLAIN QUERY PLAN " + entry["sql"], arguments or ()
+                ).fetchall()
+                entry["plan"] = [r[-1] for r in rows]
+        except sqlite3.Error as e:
+            entry["plan"] = [f"failed to explain: {e}"]
+
+        logging.getLogger("slow_query").warning(
+            f"{entry['seconds'] * 1000:.1f}ms [{entry['route']}] {entry['params']}\n"
+            f"{entry['sql']}\n"
+            f"args: {entry['arguments']}\n"
+            f"plan: {entry['plan']}"
+        )
+
+    @staticmethod
+    def _printable(arguments: object) -> object:
+        if isinstance(arguments, list):
+            return f"<{len(arguments)} rows>"
+        if isinstance(arguments, dict):
+            return {k: repr(v) for k, v in arguments.items()}
+        if arguments is not None:
+            return [repr(v) for v in arguments]
+        return None
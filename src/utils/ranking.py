@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+
+# (window, weight) pairs used for the trending score
+TRENDING_WINDOWS = [
+    ("week", 0.5),
+    ("month", 0.3),
+    ("three_months", 0.2),
+]
+
+
+def trending_score(position: dict, old_position: dict) -> float | None:
+    """
+    Weighted relative climb through the mu rankings. Positive means rising.
+    """
+
+    score = 0
+    total_weight = 0
+    for window, weight in TRENDING_WINDOWS:
+        new, old = position.get(window), old_position.get(window)
+        if not new or not old:
+            continue
+
+        score += weight * (old - new) / old
+        total_weight += weight
+
+    if total_weight == 0:
+        return None
+    return score / total_weight
+
+
+def popularity_score(lists: dict) -> int:
+    return (lists.get("reading") or 0) + (lists.get("wish") or 0)
+
+
+def composite_score(
+    bayesian_rating: float | None, popularity: int, trending: float | None
+) -> float:
+    """
+    Rating scaled by (log) popularity, nudged up or down by at most 25% for trending.
+    """
+
+    boost = max(-0.25, min(0.25, trending or 0))
+    return (bayesian_rating or 0) * math.log1p(popularity) * (1 + boost)
+
+
+def refresh_priority(
+    now: float,
+    last_fetch: np.ndarray,
+    last_updated: np.ndarray,
+    completed: np.ndarray,
+    popularity: np.ndarray,
+) -> np.ndarray:
+    """
+    How much re-fetching each series is worth, higher first.
+    Grows with the time since our last fetch, scaled up for popular series and for ones that mu updated
+    recently (likely still changing), and down for completed ones.
+    """
+
+    age_days = np.maximum(now - last_fetch, 0) / 86400
+
+    # nan (unknown) counts as a year ago
+    since_update = np.nan_to_num((now - last_updated) / 86400, nan=365)
+    activity = 1 / (1 + np.maximum(since_update, 0) / 30)
+
+    weight = (1 + np.log1p(popularity)) * (0.5 + activity)
+    weight = np.where(completed, weight * 0.2, weight)
+    return age_days * weight
@@ -0,0 +1,221 @@
+"""
+Access to raw_mu.sqlite, the unprocessed api responses written by scrape_mu_series.py.
+Rows are either json text or zstd compressed json (with a dictionary trained on the rows themselves,
+since every record has the same keys). Both can live in one file, readers don't need to care which is which.
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import zstandard
+
+from .ranking import popularity_score
+
+FORMATS = ["json", "zstd"]
+
+# big enough to hold the shared keys / boilerplate of a record, a few are ~100kb
+DICT_SIZE = 112 * 1024
+COMPRESSION_LEVEL = 9
+
+# pulled out of the json on write, so the refresh scheduler doesn't have to decode every row
+SUMMARY_COLUMNS = [
+    ("last_updated", "REAL"),
+    ("completed", "INTEGER"),
+    ("popularity", "INTEGER"),
+]
+
+
+def summarize(data: dict) -> tuple[float | None, int, int]:
+    last_updated = (data.get("last_updated") or dict()).get("timestamp")
+    lists = (data.get("rank") or dict()).get("lists") or dict()
+    return last_updated, int(bool(data.get("completed"))), popularity_score(lists)
+
+
+class RawDb:
+    def __init__(self, file: Path):
+        self.file = file
+        self.db = sqlite3.connect(file)
+
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                id              INTEGER         PRIMARY KEY,
+                last_fetch      REAL            NOT NULL,
+                data            TEXT            NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key             TEXT            PRIMARY KEY,
+                value                           NOT NULL
+            );
+            """)
+
+        self._compressor: zstandard.ZstdCompressor | None = None
+        self._decompressor: zstandard.ZstdDecompressor | None = None
+        self._load_dict()
+        self._add_summary_columns()
+
+    @property
+    def format(self) -> str:
+        """
+        Format new rows are written in.
+        """
+
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        return row[0] if row else "json"
+
+    def _load_dict(self) -> None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'dict'").fetchone()
+        if row is None:
+            self._compressor = self._decompressor = None
+            return
+
+        dict_data = zstandard.ZstdCompressionDict(row[0])
+        self._compressor = zstandard.ZstdCompressor(
+            level=COMPRESSION_LEVEL, dict_data=dict_data
+        )
+        self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+
+    def _add_summary_columns(self) -> None:
+        existing = {r[1] for r in self.db.execute("PRAGMA table_info(series)")}
+        missing = [(name, typ) for name, typ in SUMMARY_COLUMNS if name not in existing]
+        if not missing:
+            return
+
+        with self.db:
+            for name, typ in missing:
+                self.db.execute(f"ALTER TABLE series ADD COLUMN {name} {typ}")
+
+            # backfill rows written before the columns existed
+            rows = self.db.execute("SELECT id, data FROM series").fetchall()
+            self.db.executemany(
+                "UPDATE series SET last_updated = ?, completed = ?, popularity = ? WHERE id = ?",
+                [(*summarize(self.decode(raw)), id) for id, raw in rows],
+            )
+
+    ### encoding
+
+    def encode(self, data: dict) -> str | bytes:
+        text = json.dumps(data)
+        if self._compressor is None or self.format != "zstd":
+            return text
+        return self._compressor.compress(text.encode())
+
+    def decode_text(self, raw: str | bytes) -> str:
+        # sqlite hands back TEXT as str and BLOB as bytes, which is how the two formats are told apart
+        if isinstance(raw, str):
+            return raw
+        return self._decompressor.decompress(raw).decode()
+
+    def decode(self, raw: str | bytes) -> dict:
+        return json.loads(self.decode_text(raw))
+
+    ### access
+
+    def get(self, id: int) -> dict | None:
+        row = self.db.execute("SELECT data FROM series WHERE id = ?", (id,)).fetchone()
+        return self.decode(row[0]) if row else None
+
+    def put(self, id: int, data: dict, last_fetch: float) -> None:
+        self.db.execute(
+            """
+            INSERT OR REPLACE INTO series (id, last_fetch, data, last_updated, completed, popularity)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (id, last_fetch, self.encode(data), *summarize(data)),
+        )
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM series").fetchone()[0]
+
+    def all(self, batch_size: int = 5000) -> Iterator[dict]:
+        cursor = self.db.execute("SELECT data FROM series")
+        while batch := cursor.fetchmany(batch_size):
+            for (raw,) in batch:
+                yield self.decode(raw)
+
+    def fetch_stats(self) -> dict[str, np.ndarray]:
+        """
+        Columns used to decide what to refresh, one entry per series.
+        Missing last_updated timestamps are nan.
+        """
+
+        rows = self.db.execute(
+            "SELECT id, last_fetch, last_updated, completed, popularity FROM series"
+        ).fetchall()
+        columns = list(zip(*rows)) or [[]] * 5
+
+        return dict(
+            ids=np.array(columns[0], dtype=np.int64),
+            last_fetch=np.array(columns[1], dtype=np.float64),
+            last_updated=np.array(
+                [np.nan if x is None else x for x in columns[2]], dtype=np.float64
+            ),
+            completed=np.array(columns[3], dtype=bool),
+            popularity=np.array(columns[4], dtype=np.int64),
+        )
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+    ### migration
+
+    def convert(self, format: str, sample_size: int = 5000) -> None:
+        """
+        Rewrite every row in [format], then vacuum to give the space back.
+        Converting to zstd (re)trains the dictionary on a random sample of rows.
+        """
+
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format [{format}], expected one of {FORMATS}")
+
+        old_decompressor = self._decompressor
+
+        def decode_old(raw: str | bytes) -> str:
+            if isinstance(raw, str):
+                return raw
+            return old_decompressor.decompress(raw).decode()
+
+        with self.db:
+            if format == "zstd":
+                samples = [
+                    decode_old(raw).encode()
+                    for (raw,) in self.db.execute(
+                        "SELECT data FROM series ORDER BY RANDOM() LIMIT ?",
+                        (sample_size,),
+                    )
+                ]
+                dict_data = zstandard.train_dictionary(DICT_SIZE, samples)
+                compressor = zstandard.ZstdCompressor(
+                    level=COMPRESSION_LEVEL, dict_data=dict_data
+                )
+                encode = lambda text: compressor.compress(text.encode())
+            else:
+                dict_data = None
+                encode = lambda text: text
+
+            ids = [id for (id,) in self.db.execute("SELECT id FROM series")]
+            for start in range(0, len(ids), 1000):
+                chunk = ids[start : start + 1000]
+                rows = self.db.execute(
+                    f"SELECT id, data FROM series WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                self.db.executemany(
+                    "UPDATE series SET data = ? WHERE id = ?",
+                    [(encode(decode_old(raw)), id) for id, raw in rows],
+                )
+
+            self.db.execute("DELETE FROM meta WHERE key IN ('format', 'dict')")
+            self.db.execute("INSERT INTO meta VALUES ('format', ?)", (format,))
+            if dict_data is not None:
+                self.db.execute(
+                    "INSERT INTO meta VALUES ('dict', ?)", (dict_data.as_bytes(),)
+                )
+
+        self.db.execute("VACUUM")
+        self._load_dict()
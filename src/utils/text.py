@@ -0,0 +1,23 @@
+import re
+import unicodedata
+
+APOSTROPHES = re.compile(r"['’`´]")
+
+
+def normalize_title(text: str) -> str:
+    """
+    Fold a title into a form that lines up across sources, eg
+        "Kaguya-sama: Love is War" -> "kaguya sama love is war"
+        "Ｓｈｏｕｊｏ Ｃａｆé" -> "shoujo cafe"
+    Steps are NFKC (full-width / compatibility forms), casefold, diacritic removal, punctuation -> spaces, whitespace collapse.
+    """
+
+    text = unicodedata.normalize("NFKC", text).casefold()
+
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+
+    text = APOSTROPHES.sub("", text)
+    text = "".join(" " if unicodedata.category(c)[0] == "P" else c for c in text)
+
+    return " ".join(text.split())